@@ -0,0 +1,609 @@
+import os
+from datetime import datetime, timedelta
+
+from dmutils.formats import DATETIME_FORMAT
+
+from dmscripts.models import queries
+from dmscripts.models.process_rules import (
+    format_datetime_string_as_date, remove_username_from_email_address, construct_brief_url, extract_id_from_user_info
+)
+from dmscripts.models.scheduler import config_dependencies
+from dmscripts.models.sharedfetch import SharedFetches
+from dmscripts.models.stepreport import StepReport
+from dmscripts.models.writecsv import append_data, data_path, read_column, read_data, write_data
+
+
+DOS_SPECIALIST_ROLES = [
+    "agileCoach",
+    "businessAnalyst",
+    "communicationsManager",
+    "contentDesigner",
+    "securityConsultant",
+    "dataArchitect",
+    "dataEngineer",
+    "dataScientist",
+    "deliveryManager",
+    "designer",
+    "developer",
+    "performanceAnalyst",
+    "portfolioManager",
+    "productManager",
+    "programmeManager",
+    "qualityAssurance",
+    "serviceManager",
+    "technicalArchitect",
+    "userResearcher",
+    "webOperations"
+]
+DOS_SPECIALIST_ROLES_PRICE_MAX = [s + 'PriceMax' for s in DOS_SPECIALIST_ROLES]
+
+# With `--incremental`, configs with `incremental` only have the records with a `watermark` later than the last run's
+# processed and added to the end of the existing output, along with records within `overlap` of it whose `key` isn't
+# in the output yet. The watermark must be set when a record first appears in the API's listing, e.g. when a brief
+# response is submitted, as brief responses are given their id as drafts, which aren't listed. Other changes to
+# existing records, such as a brief response being awarded, aren't picked up until the next full export, so users,
+# briefs and direct award projects, which are mostly changed after they're created, are always exported in full.
+CONFIGS = [
+    {
+        'name': 'buyer_users',
+        'base_model': 'users',
+        'keys': ('id', 'emailAddress', 'createdAt', 'role'),
+        'get_data_kwargs': {},
+        'dtypes': {'role': 'category'},
+        'process_fields': {
+            'emailAddress': remove_username_from_email_address,
+            'createdAt': format_datetime_string_as_date,
+        },
+        'filter_query': "role == 'buyer' and createdAt >= '2016-04-25'",
+        'sort_by': 'createdAt'
+    },
+    {
+        'name': 'supplier_users',
+        'base_model': 'users',
+        'keys': ('id', ('supplier', 'supplierId'), 'createdAt', 'role'),
+        'get_data_kwargs': {},
+        'dtypes': {'role': 'category'},
+        'process_fields': {
+            'createdAt': format_datetime_string_as_date
+        },
+        'filter_query': "role == 'supplier' and createdAt >= '2016-04-25'",
+        'sort_by': ['createdAt', 'id']
+    },
+    {
+        'name': 'dos_services',
+        'base_model': 'services',
+        'get_data_kwargs': {
+            'framework': (
+                'digital-outcomes-and-specialists, '
+                'digital-outcomes-and-specialists-2, '
+                'digital-outcomes-and-specialists-3'
+            )
+        },
+        'keys': (
+            [
+                'id',
+                'frameworkSlug',
+                'lotSlug',
+                'status',
+                'supplierId',
+                'supplierName'
+            ] + DOS_SPECIALIST_ROLES_PRICE_MAX  # We use price max as a proxy for a service having a role
+        ),
+        'process_fields': {
+            role: bool for role in DOS_SPECIALIST_ROLES_PRICE_MAX
+        },
+        'rename_fields': dict(list(zip(DOS_SPECIALIST_ROLES_PRICE_MAX, DOS_SPECIALIST_ROLES))),
+        'dtypes': {column: 'category' for column in ('frameworkSlug', 'lotSlug', 'status')},
+        'sort_by': ['frameworkSlug', 'supplierId', 'lotSlug']
+    },
+    {
+        'name': 'g_cloud_services',
+        'base_model': 'services',
+        'get_data_kwargs': {'framework': 'g-cloud-8, g-cloud-9'},
+        'dtypes': {column: 'category' for column in ('frameworkSlug', 'lotSlug', 'status')},
+        'keys': (
+            [
+                'id',
+                'frameworkSlug',
+                'lotSlug',
+                'serviceName',
+                'status',
+                'supplierId',
+                'supplierName'
+            ]
+        ),
+        'sort_by': ['frameworkSlug', 'supplierId', 'lotSlug']
+    },
+    {
+        'name': 'briefs',
+        'base_model': 'briefs',
+        'keys': (
+            'id',
+            'createdAt',
+            'lot',
+            'title',
+            'organisation',
+            ('users', 0, 'emailAddress'),
+            'location',
+            'status',
+            'publishedAt',
+            'requirementsLength',
+            'specialistRole',
+            'clarificationQuestions',
+            'frameworkSlug',
+            'budgetRange',
+            'startDate',
+            'contractLength',
+            'isACopy',
+            'awardedBriefResponseId'
+        ),
+        'get_data_kwargs': {'with_users': 'true'},
+        'dtypes': {column: 'category' for column in ('lot', 'status', 'frameworkSlug')},
+        'process_fields': {
+            'createdAt': format_datetime_string_as_date,
+            'publishedAt': format_datetime_string_as_date,
+            'emailAddress': remove_username_from_email_address,
+            'clarificationQuestions': len,
+        },
+        'sort_by': 'createdAt'
+    },
+    {
+        'name': 'brief_responses',
+        'base_model': 'brief_responses',
+        'keys': (
+            'briefId',
+            'supplierId',
+            'createdAt',
+            'supplierName',
+            'submittedAt',
+            'essentialRequirements',
+            'id',
+            'awardedContractStartDate',
+            'awardedContractValue',
+            'supplierOrganisationSize',
+            'status',
+        ),
+        'assign_json_subfields': {
+            'awardDetails': ['awardedContractStartDate', 'awardedContractValue'],
+            'brief': ['title', 'frameworkSlug'],
+        },
+        'get_data_kwargs': {},
+        # Responses submitted around the time of the last run may not have been listed by it yet
+        'incremental': {'watermark': 'submittedAt', 'overlap': timedelta(hours=1), 'key': 'id'},
+        'dtypes': {column: 'category' for column in ('status', 'supplierOrganisationSize')},
+        'process_fields': {
+            'createdAt': format_datetime_string_as_date,
+            'submittedAt': format_datetime_string_as_date,
+            'essentialRequirements': all,
+        },
+        'sort_by': ['briefId', 'submittedAt']
+    },
+    {
+        'name': 'successful_brief_responses',
+        'model': 'brief_responses',
+        'joins': [
+            {
+                'model_name': 'briefs',
+                'left_on': 'briefId',
+                'right_on': 'id',
+                'data_duplicate_suffix': '_brief_responses'
+            }
+        ],
+        'filter_query': "essentialRequirements",
+        'keys': (
+            'briefId',
+            'lot',
+            'title',
+            'supplierId',
+            'supplierName',
+            'submittedAt',
+            'status_briefs',
+            'awardedBriefResponseId',
+            'awardedContractStartDate',
+            'awardedContractValue',
+            'supplierOrganisationSize'
+        ),
+        'rename_fields': {'status_briefs': 'status'},
+        'sort_by': ['briefId', 'submittedAt']
+    },
+    {
+        'name': 'brief_responses_summary',
+        'model': 'briefs',
+        'add_counts': {
+            'model_name': 'brief_responses',
+            'join': ('id', 'briefId'),
+            'group_by': 'essentialRequirements'
+        },
+        'filter_query': "status in ['live', 'closed', 'awarded', 'withdrawn', 'cancelled', 'unsuccessful']",
+        'keys': (
+            'id',
+            'lot',
+            'title',
+            'status',
+            'essentialRequirements-False',
+            'essentialRequirements-True',
+            'clarificationQuestions',
+            'frameworkSlug',
+            'specialistRole',
+            'awardedBriefResponseId'
+        ),
+        'sort_by': ['id']
+    },
+    {
+        'name': 'awarded_brief_responses',
+        'model': 'brief_responses',
+        'filter_query': 'status == "awarded"',
+        'keys': (
+            'briefId',
+            'awardedContractStartDate',
+            'awardedContractValue',
+            'supplierOrganisationSize',
+            'supplierName'
+        ),
+        'sort_by': ['briefId'],
+        'rename_fields': {
+            'awardedContractStartDate': 'awarded_awardedContractStartDate',
+            'awardedContractValue': 'awarded_awardedContractValue',
+            'supplierOrganisationSize': 'awarded_supplierOrganisationSize',
+            'supplierName': 'awarded_supplierName'
+        }
+    },
+    {
+        'name': 'opportunity-data',
+        'model': 'briefs',
+        'filter_query': 'status_data in ["closed", "cancelled", "unsuccessful", "awarded"]',
+        'joins': [
+            {
+                'model_name': 'awarded_brief_responses',
+                'left_on': 'id',
+                'right_on': 'briefId',
+                'data_duplicate_suffix': '_awarded_brief_responses'
+            }, {
+                'model_name': 'brief_responses',
+                'left_on': 'id',
+                'right_on': 'briefId',
+                'data_duplicate_suffix': '_data'
+            },
+
+        ],
+        'keys': (
+            'brief_id_copy',
+            'title',
+            'id_data',
+            'frameworkSlug',
+            'lot',
+            'specialistRole',
+            'organisation',
+            'emailAddress',
+            'location',
+            'publishedAt',
+            'requirementsLength',
+            'contractLength',
+            'applicationsFromSMEs',
+            'applicationsFromLargeOrganisations',
+            'totalApplications',
+            'status_data',
+            'awarded_supplierName',
+            'awarded_supplierOrganisationSize',
+            'awarded_awardedContractValue',
+            'awarded_awardedContractStartDate',
+        ),
+        'aggregation_counts': [
+            {
+                'group_by': 'id_data',
+                'join': ('id_data', 'id_data'),
+                'count_name': 'totalApplications',
+                'query': 'id_brief_responses != ""',
+            }, {
+                'group_by': 'id_data',
+                'join': ('id_data', 'id_data'),
+                'count_name': 'applicationsFromSMEs',
+                'query': 'supplierOrganisationSize in ["micro", "small", "medium"]',
+            }, {
+                'group_by': 'id_data',
+                'join': ('id_data', 'id_data'),
+                'count_name': 'applicationsFromLargeOrganisations',
+                'query': 'supplierOrganisationSize == "large"',
+            },
+        ],
+        'duplicate_fields': [('id_data', 'brief_id_copy')],
+        'process_fields': {
+            'id_data': construct_brief_url,
+            'emailAddress': remove_username_from_email_address,
+            'requirementsLength': lambda i: i or '2 weeks',
+        },
+        'rename_fields': {
+            'brief_id_copy': 'ID',
+            'title': 'Opportunity',
+            'id_data': 'Link',
+            'frameworkSlug': 'Framework',
+            'lot': 'Category',
+            'specialistRole': 'Specialist',
+            'organisation': 'Organisation Name',
+            'emailAddress': 'Buyer Domain',
+            'location': 'Location Of The Work',
+            'publishedAt': 'Published At',
+            'requirementsLength': 'Open For',
+            'contractLength': 'Expected Contract Length',
+            'applicationsFromSMEs': 'Applications from SMEs',
+            'applicationsFromLargeOrganisations': 'Applications from Large Organisations',
+            'totalApplications': 'Total Organisations',
+            'status_data': 'Status',
+            'awarded_supplierName': 'Winning supplier',
+            'awarded_supplierOrganisationSize': 'Size of supplier',
+            'awarded_awardedContractValue': 'Contract amount',
+            'awarded_awardedContractStartDate': 'Contract start date'
+        },
+        'drop_duplicates': True,
+    },
+    {
+        'name': 'direct_award_projects',
+        'base_model': 'direct_award_projects',
+        'keys': (
+            'id',
+            'createdAt',
+            'lockedAt',
+            'downloadedAt',
+            'active',
+            'users',
+        ),
+        'get_data_kwargs': {'with_users': True},
+        'process_fields': {
+            'createdAt': format_datetime_string_as_date,
+            'lockedAt': format_datetime_string_as_date,
+            'downloadedAt': format_datetime_string_as_date,
+            'users': extract_id_from_user_info
+        },
+        'rename_fields': {'users': 'userId'},
+    },
+    {
+        'name': 'direct_award_project_locked_search_services_count',
+        'model': 'direct_award_projects',
+        'get_by_model_fk': {
+            'model_to_get': 'direct_award_project_services',
+            'fk_column_name': 'project_id',
+            'get_data_kwargs': {},
+            'filter_before_request_query': 'lockedAt == lockedAt',
+        },
+        'group_by': 'projectId',
+        'keys': {
+            'projectId',
+            'count'
+        },
+        'process_fields': {'projectId': int},
+        'rename_fields': {'count': 'lockedSearchServicesCount'}
+    },
+    {
+        'name': 'direct_award_project_saved_searches_count',
+        'model': 'direct_award_projects',
+        'get_by_model_fk': {
+            'model_to_get': 'direct_award_project_searches',
+            'fk_column_name': 'project_id',
+            'get_data_kwargs': {}
+        },
+        'keys': {
+            'projectId',
+            'count',
+        },
+        'group_by': 'projectId',
+        'rename_fields': {'count': 'savedSearchesCount'},
+    },
+    {
+        'name': 'direct_award_projects_with_search_data',
+        'model': 'direct_award_projects',
+        'joins': [
+            {
+                'model_name': 'direct_award_project_locked_search_services_count',
+                'left_on': 'id',
+                'right_on': 'projectId',
+            },
+            {
+                'model_name': 'direct_award_project_saved_searches_count',
+                'left_on': 'id',
+                'right_on': 'projectId',
+                'how': 'outer',
+            },
+        ],
+        'keys': (
+            'id',
+            'createdAt',
+            'lockedAt',
+            'downloadedAt',
+            'active',
+            'userId',
+            'savedSearchesCount',
+            'lockedSearchServicesCount',
+        ),
+    },
+]
+
+# Models that other configs are built from. Only these are written in the `--format` given, as the rest are
+# published as CSVs.
+INTERMEDIATE_MODELS = set().union(*map(config_dependencies, CONFIGS))
+
+
+def new_records(config, data, since, output_dir):
+    """Return a mask of the records of an `incremental` config's data that aren't in its output yet.
+
+    These are the records past the `since` watermark, and any records within the config's `overlap` of it that were
+    listed too late for the last run.
+    """
+    incremental = config['incremental']
+    mask = data[incremental['watermark']] > since
+
+    if incremental.get('overlap'):
+        overlap_since = datetime.strptime(since, DATETIME_FORMAT) - incremental['overlap']
+        exported = read_column(output_dir, config['name'], incremental['key'])
+        mask |= (data[incremental['watermark']] > overlap_since.strftime(DATETIME_FORMAT)) & \
+            ~data[incremental['key']].astype(str).isin(exported)
+
+    return mask
+
+
+def process_config(
+    config, client, output_dir, logger, registry=None, data_format='csv', fk_workers=1, fetches=None, report=None,
+    watermarks=None, incremental=False, **base_model_kwargs
+):
+    """Load the data for a config, process it according to the config's rules and write it to a CSV.
+
+    :param registry: A FrameRegistry holding the output of earlier configs, which this config's output is added to.
+    :param data_format: A format to also write the output in, if other configs are built from it, which they read
+                        it back from. See `DATA_FORMATS`.
+    :param fk_workers: Number of requests to make at once for `get_by_model_fk`.
+    :param fetches: A SharedFetches for the configs being run, so configs can share the data they fetch.
+    :param report: A StepReport to record the rows, time and memory of each step in.
+    :param watermarks: Watermarks to save the watermark of `incremental` configs to, and to record changes in.
+    :param incremental: Only process and add the rows of `incremental` configs past their saved watermark, and skip
+                        configs built from models that haven't changed. Requires `watermarks`.
+    :param base_model_kwargs: Additional kwargs for `queries.base_model`, e.g. `limit`. A `cache` is only resumed from
+                              for the new records of an incremental run of an `incremental` config, as cached
+                              records may be out of date; a full run of an `incremental` config refreshes it.
+    """
+    logger.info('Processing {} data'.format(config['name']))
+    steps = (report or StepReport()).recorder(config['name'])
+    # The CSV is always written, as it's what's published
+    output_formats = ['csv'] + ([data_format] if data_format != 'csv' and config['name'] in INTERMEDIATE_MODELS else [])
+    output_exists = all(
+        os.path.exists(data_path(output_dir, config['name'], output_format)) for output_format in output_formats
+    )
+
+    if incremental and 'model' in config and output_exists and \
+            not watermarks.any_changed(config_dependencies(config)):
+        logger.info('Skipping {}, as the models it is built from are unchanged'.format(config['name']))
+        return
+
+    watermark = config['incremental']['watermark'] \
+        if 'incremental' in config and 'base_model' in config and watermarks is not None else None
+    since = watermarks.get(config['name']) if incremental and watermark and output_exists else None
+
+    if base_model_kwargs.get('cache') is not None and since is None:
+        if 'incremental' in config:
+            base_model_kwargs['cache'] = base_model_kwargs['cache'].refreshing()
+        else:
+            del base_model_kwargs['cache']
+
+    if 'base_model' in config:
+        def fetch(required_keys):
+            return queries.base_model(config['base_model'], required_keys, config['get_data_kwargs'],
+                                      client=client, logger=logger, dtypes=config.get('dtypes'), **base_model_kwargs)
+
+        data = (fetches or SharedFetches([])).get(config, fetch)
+        steps.record('fetch', data)
+
+        if watermark:
+            # Records that aren't past any watermark yet, such as unsubmitted brief responses, have a blank one
+            new_watermark = (data[watermark].max() if len(data) else None) or since
+            if since is not None:
+                data = data[new_records(config, data, since, output_dir)]
+                steps.record('new_rows', data)
+                logger.info('{} {} added since {} {}'.format(len(data), config['name'], watermark, since))
+                if not len(data):
+                    return
+
+    elif 'model' in config:
+        data = queries.model(config['model'], directory=output_dir, registry=registry, data_format=data_format)
+        steps.record('load', data)
+
+    if 'load_columns' in config:
+        data = data[[column for column in data.columns if column in config['load_columns']]]
+        steps.record('load_columns', data)
+
+    if 'early_filter_query' in config:
+        data = queries.filter_rows(config['early_filter_query'], data)
+        steps.record('early_filter', data)
+        logger.info(
+            '{} {} remaining after early filtering'.format(len(data), config['name'])
+        )
+
+    if 'joins' in config:
+        for join in config['joins']:
+            data = queries.join(data, directory=output_dir, registry=registry, data_format=data_format, **join)
+            steps.record('join', data)
+
+    if 'get_by_model_fk' in config:
+        data = queries.get_by_model_fk(
+            config['get_by_model_fk'],
+            config['keys'],
+            data,
+            client,
+            workers=fk_workers
+        )
+        steps.record('get_by_model_fk', data)
+
+    # transform values that we want to transform
+    if 'assign_json_subfields' in config:
+        for field, subfields in config['assign_json_subfields'].items():
+            data = queries.assign_json_subfields(field, subfields, data)
+        steps.record('subfields', data)
+
+    if 'duplicate_fields' in config:
+        for field, new_name in config['duplicate_fields']:
+            data = queries.duplicate_fields(data, field, new_name)
+        steps.record('duplicate_fields', data)
+
+    if 'process_fields' in config:
+        data = queries.process_fields(config['process_fields'], data)
+        steps.record('process', data)
+
+    if 'add_counts' in config:
+        data = queries.add_counts(
+            data=data, directory=output_dir, registry=registry, data_format=data_format, **config['add_counts']
+        )
+        steps.record('counts', data)
+
+    if 'aggregation_counts' in config:
+        data = queries.add_all_aggregation_counts(data, config['aggregation_counts'])
+        steps.record('aggregation_counts', data)
+
+    if 'filter_query' in config:
+        # filter out things we don't want
+        data = queries.filter_rows(config['filter_query'], data)
+        steps.record('filter', data)
+        logger.info(
+            '{} {} remaining after filtering'.format(len(data), config['name'])
+        )
+
+    if 'group_by' in config:
+        data = queries.group_by(config['group_by'], data)
+        steps.record('group', data)
+
+    # Only keep requested keys in the output CSV
+    keys = [
+        k[-1] if isinstance(k, (tuple, list)) else k
+        for k in config['keys']
+        if (k[-1] if isinstance(k, (tuple, list)) else k) in data
+    ]
+    data = data[keys]
+    steps.record('keys', data)
+
+    if 'rename_fields' in config:
+        data = queries.rename_fields(config['rename_fields'], data)
+        steps.record('rename', data)
+
+    # sort list by some dict value
+    if 'sort_by' in config:
+        data = queries.sort_by(config['sort_by'], data)
+        steps.record('sort', data)
+    if 'drop_duplicates' in config and config['drop_duplicates']:
+        data = queries.drop_duplicates(data)
+        steps.record('drop_duplicates', data)
+    for output_format in output_formats:
+        if since is not None:
+            # Configs built from this one read the whole of it back from the file
+            filename = append_data(data, output_dir, config['name'], output_format)
+            logger.info('Added {} rows to `{}`'.format(len(data), filename))
+        else:
+            # write up your CSV
+            filename = write_data(data, output_dir, config['name'], output_format)
+            logger.info('Printed `{}` with {} rows'.format(filename, len(data)))
+    steps.record('write', data)
+
+    if since is None and registry is not None and registry.keeps(config['name']):
+        # Hold the output as it's read back from the file, so the configs built from it give the same output as when
+        # they're run on their own and read the file themselves
+        registry.add(config['name'], read_data(output_dir, config['name'], data_format))
+
+    if watermarks is not None:
+        if watermark and new_watermark is not None:
+            watermarks.set(config['name'], new_watermark)
+        watermarks.mark_changed(config['name'])
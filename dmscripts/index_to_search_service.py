@@ -1,24 +1,43 @@
-from datetime import datetime
-from multiprocessing.pool import ThreadPool
+import collections
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
 
 import dmapiclient
-from six.moves import map
+from dmutils.formats import DATE_FORMAT, DATETIME_FORMAT
+from six.moves import map, queue
 
 from dmscripts.helpers import logging_helpers
 from dmscripts.helpers.logging_helpers import logging
+from dmscripts.models.modeltrawler import ModelTrawler
 
 logger = logging_helpers.configure_logger({"dmapiclient": logging.WARNING})
 
 
-def print_progress(counter, start_time):
+def print_progress(counter, start_time, label=None):
     if counter % 100 == 0:
         time_delta = datetime.utcnow() - start_time
-        logger.info("{counter} in {time} ({rps}/s)", extra={
+        logger.info("{label}{counter} in {time} ({rps}/s)", extra={
+            'label': '{}: '.format(label) if label else '',
             'counter': counter, 'time': time_delta, 'rps': counter / time_delta.total_seconds()
         })
 
 
+class DeletedItem(dict):
+    """An item found from its audit events that no longer exists, so is deleted from the index."""
+
+    def __init__(self, item_id):
+        super(DeletedItem, self).__init__(id=item_id)
+
+
 class IndexerBase(object):
+    # The name of the model indexed, which is also the `objectType` of the audit events of changes to it
+    model = None
+
     def __init__(self, document_type, data_client, search_client, index):
         self.document_type = document_type
         self.index = index
@@ -26,20 +45,65 @@ class IndexerBase(object):
         self.data_client = data_client
 
     def create_index(self, mapping):
+        """Create the index, returning whether it was created rather than being an existing alias."""
         logger.info("Creating {index} index", extra={'index': self.index})
 
         try:
             result = self.search_client.create_index(self.index, mapping=mapping)
             logger.info("Index creation response: {response}", extra={'response': result})
+            return True
         except dmapiclient.HTTPError as e:
             if 'already exists as alias' in str(e.message):
                 logger.info("Skipping index creation for alias {index}", extra={'index': self.index})
+                return False
             else:
                 raise
 
     def request_items(self, frameworks):
         raise NotImplementedError()
 
+    def request_item(self, item_id):
+        """Return the item with the given id, or None if it doesn't exist."""
+        raise NotImplementedError()
+
+    def request_pages(self, frameworks, start_page=1):
+        """Yield each page of items on `frameworks`, as a list, from `start_page` onwards."""
+        trawler = ModelTrawler(self.model, self.data_client)
+        for result in trawler.iter_pages(start_page=start_page, framework=frameworks):
+            yield trawler.page_models(result)
+
+    def audit_event_item_id(self, audit_event):
+        """Return the id of the item an audit event is about, or None if it doesn't say."""
+        return audit_event['objectId']
+
+    def request_items_changed_since(self, frameworks, since):
+        """Return the items on `frameworks` that have changed since `since`, a DATETIME_FORMAT string.
+
+        Changed items are found from the audit events of changes made to them, newest first, so each changed item
+        is fetched once in its current state. Items that no longer exist are returned as a `DeletedItem`, whatever
+        framework they were on, so they're deleted from the index.
+        """
+        framework_slugs = set(slug.strip() for slug in frameworks.split(','))
+        audit_events = self.data_client.find_audit_events_iter(object_type=self.model, latest_first=True)
+        changed_ids, seen_ids = [], set()
+        for audit_event in audit_events:
+            if audit_event['createdAt'] <= since:
+                break
+            item_id = self.audit_event_item_id(audit_event)
+            if item_id is None:
+                logger.warning("Audit event {id} has no {object_type} id", extra={
+                    'id': audit_event.get('id'), 'object_type': self.model
+                })
+            elif item_id not in seen_ids:
+                seen_ids.add(item_id)
+                changed_ids.append(item_id)
+
+        logger.info("{count} {object_type} changed since {since}", extra={
+            'count': len(changed_ids), 'object_type': self.model, 'since': since
+        })
+        items = (self.request_item(item_id) or DeletedItem(item_id) for item_id in changed_ids)
+        return (item for item in items if isinstance(item, DeletedItem) or item['frameworkSlug'] in framework_slugs)
+
     def __call__(self, item):
         try:
             self.index_item(item)
@@ -48,31 +112,109 @@ class IndexerBase(object):
             logger.exception("{id} not indexed", extra={'id': item.get('id')})
             return False
 
+    def index_items(self, items):
+        """Index or delete a batch of items, returning whether each one succeeded.
+
+        If the search client has a `bulk(index, actions)` method the batch is sent in one request, with an action
+        for each item of `{'action': 'index' or 'delete', 'id': ..., 'doc_type': ..., 'document': ...}`. It must
+        return a result for each action, in any order, of `{'id': ..., 'error': None or a message}`, and if it
+        doesn't, every item counts as failed. Otherwise each item is sent on its own.
+        """
+        bulk = getattr(self.search_client, 'bulk', None)
+        if bulk is None:
+            return [self(item) for item in items]
+
+        try:
+            results = bulk(self.index, [self.item_action(item) for item in items])
+        except dmapiclient.APIError:
+            logger.exception("{count} items not indexed", extra={'count': len(items)})
+            return [False] * len(items)
+
+        # Ids may come back as strings whatever type they were sent as
+        errors = {str(result['id']): result.get('error') for result in results if 'id' in result}
+        if len(results) != len(items) or set(errors) != set(str(item['id']) for item in items):
+            logger.error("{count} items not indexed: expected a result for each, got {results}", extra={
+                'count': len(items), 'results': results
+            })
+            return [False] * len(items)
+
+        for item_id, error in errors.items():
+            if error:
+                logger.error("{id} not indexed: {error}", extra={'id': item_id, 'error': error})
+
+        return [not errors[str(item['id'])] for item in items]
+
+    def item_action(self, item):
+        if self.should_index(item):
+            return {'action': 'index', 'id': item['id'], 'doc_type': self.document_type, 'document': item}
+        return {'action': 'delete', 'id': item['id']}
+
     def include_in_index(self, item):
         raise NotImplementedError()
 
+    def should_index(self, item):
+        return not isinstance(item, DeletedItem) and self.include_in_index(item)
+
     def index_item(self, item):
-        if self.include_in_index(item):
+        if self.should_index(item):
             self.search_client.index(self.index, item['id'], item, self.document_type)
         else:
             self.search_client.delete(self.index, item['id'])
 
 
 class BriefIndexer(IndexerBase):
+    model = 'briefs'
+
     def request_items(self, frameworks):
         # despite the name, `framework` takes a string containing a comma-separated list of framework slugs
         return self.data_client.find_briefs_iter(framework=frameworks)
 
+    def request_item(self, item_id):
+        try:
+            return self.data_client.get_brief(item_id)['briefs']
+        except dmapiclient.HTTPError as e:
+            if e.status_code != 404:
+                raise
+
+    def request_items_changed_since(self, frameworks, since):
+        # Briefs close when their closing date passes, which isn't an audited change
+        since_date = datetime.strptime(since, DATETIME_FORMAT).date()
+        closed_briefs = (
+            brief
+            for days in range((datetime.utcnow().date() - since_date).days + 1)
+            for brief in self.data_client.find_briefs_iter(
+                framework=frameworks, closed_on=(since_date + timedelta(days=days)).strftime(DATE_FORMAT)
+            )
+        )
+        changed_briefs = super(BriefIndexer, self).request_items_changed_since(frameworks, since)
+
+        seen_ids = set()
+        for brief in itertools.chain(changed_briefs, closed_briefs):
+            if brief['id'] not in seen_ids:
+                seen_ids.add(brief['id'])
+                yield brief
+
     def include_in_index(self, item):
         # Even draft briefs will be in the index, for now at least
         return True
 
 
 class ServiceIndexer(IndexerBase):
+    model = 'services'
+
     def request_items(self, frameworks):
         # despite the name, frameworks takes a string containing a comma-separated list of framework slugs
         return self.data_client.find_services_iter(framework=frameworks)
 
+    def request_item(self, item_id):
+        # Services that have been changed to anything but `published` are included, so they're deleted from the index
+        service = self.data_client.get_service(item_id)
+        return service['services'] if service else None
+
+    def audit_event_item_id(self, audit_event):
+        # A service's audit events have its internal database id as their `objectId`, and its public id in their data
+        return (audit_event.get('data') or {}).get('serviceId')
+
     def include_in_index(self, item):
         return item['status'] == 'published'
 
@@ -101,32 +243,413 @@ def search_mapping_matches_framework(mapping_name, frameworks):
     raise ValueError("Incorrect mapping '{}' for the supplied framework(s): {}".format(mapping_name, frameworks))
 
 
+def batches(items, size):
+    items = iter(items)
+    return iter(lambda: list(itertools.islice(items, size)), [])
+
+
+# Markers passed between the threads of `run_pipeline`
+_RESULT, _ERROR, _FETCHED, _FINISHED = object(), object(), object(), object()
+
+
+def run_pipeline(sources, process, workers=10, queue_size=100):
+    """Yield `process(item)` for every item of every source, in the order they finish.
+
+    Each source is iterated by its own fetcher thread, which puts its items on a queue holding at most `queue_size`
+    items. `workers` threads take items off the queue and process them, so fetching carries on while items are being
+    processed, and stops when the queue is full rather than holding everything fetched in memory.
+
+    An error fetching or processing an item is raised here. The threads are daemons, so a fetcher left waiting on a
+    full queue won't keep the script running.
+    """
+    items = queue.Queue(maxsize=queue_size)
+    results = queue.Queue()
+
+    def fetch(source):
+        try:
+            for item in source:
+                items.put(item)
+            results.put((_FETCHED, None))
+        except Exception as e:
+            results.put((_ERROR, e))
+
+    def work():
+        for item in iter(items.get, _FINISHED):
+            try:
+                results.put((_RESULT, process(item)))
+            except Exception as e:
+                results.put((_ERROR, e))
+                return
+        results.put((_FINISHED, None))
+
+    threads = [threading.Thread(target=fetch, args=(source,)) for source in sources]
+    threads += [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    fetching, working = len(sources), workers
+    if not fetching:
+        for _ in range(workers):
+            items.put(_FINISHED)
+
+    while working:
+        kind, value = results.get()
+        if kind is _RESULT:
+            yield value
+        elif kind is _ERROR:
+            raise value
+        elif kind is _FETCHED:
+            fetching -= 1
+            if not fetching:
+                for _ in range(workers):
+                    items.put(_FINISHED)
+        else:
+            working -= 1
+
+
+class AdaptiveConcurrency(object):
+    """Limits how many requests are made at once, adjusting the limit by additive increase/multiplicative decrease.
+
+    The limit starts at `floor` and goes up by one each time as many requests as the limit succeed in under
+    `max_latency` seconds. It's multiplied by `decrease` when a request fails or takes longer than that. Requests
+    started before the last decrease don't decrease it again, as they were made at the old limit. The limit never
+    goes below `floor` or above `ceiling`.
+    """
+
+    def __init__(self, floor, ceiling, max_latency=1.0, decrease=0.5):
+        # With a floor of 0 the limit could fall to nothing, and every request would wait forever
+        if not 1 <= floor <= ceiling:
+            raise ValueError("Concurrency floor must be between 1 and the ceiling ({}), not {}".format(ceiling, floor))
+
+        self.floor = floor
+        self.ceiling = ceiling
+        self.max_latency = max_latency
+        self.decrease = decrease
+        self.limit = float(floor)
+        self._in_flight = 0
+        self._decreases = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request can be made, returning a token to pass to `release`."""
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return self._decreases, time.perf_counter()
+
+    def release(self, token, ok):
+        """Record that the request `token` was acquired for has finished, and whether it succeeded."""
+        decreases, started = token
+        latency = time.perf_counter() - started
+
+        with self._condition:
+            self._in_flight -= 1
+            if ok and latency < self.max_latency:
+                self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+            elif decreases == self._decreases:
+                self.limit = max(self.floor, self.limit * self.decrease)
+                self._decreases += 1
+                logger.info("Reduced concurrency to {limit} after a {outcome} request", extra={
+                    'limit': int(self.limit), 'outcome': 'slow' if ok else 'failed'
+                })
+            self._condition.notify_all()
+
+
+class IndexCheckpoint(object):
+    """Records how many pages of items a reindex has finished in a file, so that it can be resumed if interrupted.
+
+    Items are indexed out of order, so a page is finished once every item on it and on the pages before it has been
+    indexed or has failed. The file is saved each time another page is finished, and removed once the reindex is.
+    Items moved between pages while a reindex is interrupted can be missed, so resumed reindexes should be followed
+    by a reindex of the items changed since the checkpoint's `started_at`.
+    """
+
+    def __init__(self, path, run):
+        """
+        :param run: A dict describing the reindex, which a resumed reindex must match.
+        """
+        self.path = path
+        self.run = run
+        self.started_at = datetime.utcnow().strftime(DATETIME_FORMAT)
+        self.pages_finished = 0
+        self.failed = 0
+        self._remaining = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def resume(self):
+        """Load the saved checkpoint, if there is one, and return the page to carry on from."""
+        if not os.path.exists(self.path):
+            logger.info("No checkpoint in {path}, starting from the first page", extra={'path': self.path})
+            return 1
+
+        with open(self.path) as f:
+            saved = json.load(f)
+        if saved['run'] != self.run:
+            raise ValueError("Checkpoint {} is for a different reindex: {}".format(self.path, saved['run']))
+
+        self.started_at, self.pages_finished, self.failed = saved['started_at'], saved['pages'], saved['failed']
+        logger.info("Resuming from page {page}", extra={'page': self.pages_finished + 1})
+        return self.pages_finished + 1
+
+    def page_fetched(self, page, count):
+        with self._lock:
+            self._remaining[page] = count
+            self._failed[page] = 0
+            self._finish_pages()
+
+    def items_done(self, page, results):
+        with self._lock:
+            self._remaining[page] -= len(results)
+            self._failed[page] += results.count(False)
+            self._finish_pages()
+
+    def finish(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _finish_pages(self):
+        finished = False
+        while self._remaining.get(self.pages_finished + 1) == 0:
+            self.pages_finished += 1
+            del self._remaining[self.pages_finished]
+            self.failed += self._failed.pop(self.pages_finished)
+            finished = True
+
+        if finished:
+            # Write to a temporary file first so an interruption can't leave a truncated checkpoint behind
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump({
+                    'run': self.run, 'started_at': self.started_at, 'pages': self.pages_finished, 'failed': self.failed
+                }, f)
+            os.replace(self.path + '.tmp', self.path)
+
+
+class DocumentHashes(object):
+    """A store of the hash of the last document sent successfully for each item, by index and id, kept in a file.
+
+    Items whose document is the same as the one last sent needn't be sent again. The hash covers whether the item
+    was indexed or deleted, so an item leaving the index is still deleted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self._hashes = json.load(f)
+        else:
+            self._hashes = {}
+
+    @staticmethod
+    def digest(action):
+        return hashlib.sha1(json.dumps(action, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def get(self, index, item_id):
+        with self._lock:
+            return self._hashes.get(index, {}).get(str(item_id))
+
+    def set(self, index, item_id, digest):
+        with self._lock:
+            self._hashes.setdefault(index, {})[str(item_id)] = digest
+
+    def clear(self, index):
+        """Forget every document sent to `index`, e.g. because it has been created afresh."""
+        with self._lock:
+            self._hashes.pop(index, None)
+
+    def save(self):
+        with self._lock:
+            # Write to a temporary file first so an interruption can't leave a truncated store behind
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self._hashes, f)
+            os.replace(self.path + '.tmp', self.path)
+
+
+def send_changed(indexer, hashes, items, send, force=False):
+    """Send the items whose document has changed since it was last sent with `send(items)`, returning whether each
+    item succeeded. Unchanged items succeed without being sent, unless `force` is set.
+    """
+    digests = [hashes.digest(indexer.item_action(item)) for item in items]
+    changed = [
+        position for position, (item, digest) in enumerate(zip(items, digests))
+        if force or hashes.get(indexer.index, item['id']) != digest
+    ]
+
+    results = [True] * len(items)
+    for position, ok in zip(changed, send([items[position] for position in changed]) if changed else []):
+        results[position] = ok
+        if ok:
+            hashes.set(indexer.index, items[position]['id'], digests[position])
+
+    return results
+
+
+def index_process(indexer, bulk_size=1, hashes=None, force=False):
+    """Return a function that indexes a `(page_number, item)` entry from `do_index`, or a batch of items if
+    `bulk_size` is set, returning the page number and whether each item succeeded.
+
+    Batches are only sent in one request by search clients with a `bulk` method, so one without is refused rather
+    than sending each item of a batch on its own.
+    """
+    if bulk_size > 1 and getattr(indexer.search_client, 'bulk', None) is None:
+        raise ValueError("The search API client can't send items in bulk, so the bulk size must be 1")
+
+    def send(items):
+        return indexer.index_items(items) if bulk_size > 1 else [indexer(item) for item in items]
+
+    def process(entry):
+        page_number, entry = entry
+        items = entry if bulk_size > 1 else [entry]
+        if hashes is not None:
+            return page_number, send_changed(indexer, hashes, items, send, force=force)
+        return page_number, send(items)
+
+    return process
+
+
+def create_index(indexer, mapping, frameworks, hashes=None):
+    """Create `do_index`'s index from `mapping`, forgetting the documents `hashes` has recorded as sent to any earlier
+    index of the same name, as the new index holds none of them.
+    """
+    if search_mapping_matches_framework(mapping, frameworks) and indexer.create_index(mapping=mapping) and \
+            hashes is not None:
+        hashes.clear(indexer.index)
+
+
+def limit_concurrency(process, concurrency):
+    """Wrap `do_index`'s `process` so each call waits for and reports back to an AdaptiveConcurrency."""
+    def limited_process(entry):
+        token = concurrency.acquire()
+        ok = False
+        try:
+            page_number, results = process(entry)
+            ok = all(results)
+        finally:
+            concurrency.release(token, ok)
+        return page_number, results
+
+    return limited_process
+
+
+def item_streams(indexer, frameworks, since=None, checkpoint=None, start_page=1, per_framework=False):
+    """Return the streams of items for `do_index` to fetch at once, as `(label, pages)` pairs.
+
+    Each of `pages` is a `(page_number, items)` pair. Items are only fetched a page at a time, with page numbers, for
+    a checkpoint to record. With `per_framework` each framework is fetched in a stream of its own, labelled with its
+    slug, unless the items are changed items found from audit events or are being checkpointed.
+    """
+    if since:
+        return [(None, [(None, indexer.request_items_changed_since(frameworks, since))])]
+    if checkpoint is not None:
+        return [(None, enumerate(indexer.request_pages(frameworks, start_page=start_page), start_page))]
+    if per_framework:
+        return [(slug.strip(), [(None, indexer.request_items(slug.strip()))]) for slug in frameworks.split(',')]
+
+    return [(None, [(None, indexer.request_items(frameworks))])]
+
+
 def do_index(doc_type, search_api_url, search_api_access_token, data_api_url, data_api_access_token, mapping, serial,
-             index, frameworks):
+             index, frameworks, bulk_size=1, workers=10, queue_size=100, since=None, watermarks=None,
+             checkpoint_file=None, resume=False, min_workers=None, max_latency=1.0, hash_store=None, force=False,
+             fetch_per_framework=False):
+    """Index the briefs or services on `frameworks`, returning whether every item was indexed.
+
+    :param since: Only index the items changed since this DATETIME_FORMAT string.
+    :param watermarks: Watermarks to save the time of each successful run to, by index. Without `since`, only the
+                       items changed since the last successful run to the index are indexed, if there is one.
+    :param checkpoint_file: Record progress through a full reindex in this file. See `IndexCheckpoint`.
+    :param resume: Carry on from the progress recorded in `checkpoint_file`.
+    :param min_workers: Adjust the number of items sent at once between this and `workers`, by how quickly and
+                        successfully the search API responds, unless `serial`. See `AdaptiveConcurrency`.
+    :param max_latency: Seconds a request to the search API can take before it counts as slow, with `min_workers`.
+    :param hash_store: Don't send items whose document hasn't changed since it was last sent, according to the
+                       hashes kept in this file. See `DocumentHashes`.
+    :param force: Send every item, even if it hasn't changed, while still updating `hash_store`.
+    :param fetch_per_framework: Fetch the items on each of `frameworks` at once, counting each one's progress. See
+                                `item_streams`.
+    """
+    started_at = datetime.utcnow().strftime(DATETIME_FORMAT)
+    if since is None and watermarks is not None:
+        since = watermarks.get(index)
+
     logger.info("Search API URL: {search_api_url}", extra={'search_api_url': search_api_url})
     logger.info("Data API URL: {data_api_url}", extra={'data_api_url': data_api_url})
 
-    if serial:
-        mapper = map
-    else:
-        pool = ThreadPool(10)
-        mapper = pool.imap_unordered
-
     indexer = indexers[doc_type](
         doc_type,
         dmapiclient.DataAPIClient(data_api_url, data_api_access_token),
         dmapiclient.SearchAPIClient(search_api_url, search_api_access_token),
         index)
-    if mapping and search_mapping_matches_framework(mapping, frameworks):
-        indexer.create_index(mapping=mapping)
+    hashes = DocumentHashes(hash_store) if hash_store else None
+    process = index_process(indexer, bulk_size, hashes, force)
+
+    if mapping:
+        create_index(indexer, mapping, frameworks, hashes)
+
+    checkpoint, start_page = None, 1
+    if since:
+        logger.info("Indexing {doc_type} changed since {since}", extra={'doc_type': doc_type, 'since': since})
+    elif checkpoint_file:
+        checkpoint = IndexCheckpoint(checkpoint_file, {'doc_type': doc_type, 'index': index, 'frameworks': frameworks})
+        start_page = checkpoint.resume() if resume else 1
+        started_at = checkpoint.started_at
+
+    def entries(label, pages):
+        for page_number, items in pages:
+            if checkpoint is not None:
+                checkpoint.page_fetched(page_number, len(items))
+            for entry in batches(items, bulk_size) if bulk_size > 1 else items:
+                yield (label, page_number), entry
+
+    sources = [
+        entries(label, pages)
+        for label, pages in item_streams(indexer, frameworks, since, checkpoint, start_page, fetch_per_framework)
+    ]
+
+    if serial:
+        results = map(process, itertools.chain.from_iterable(sources))
+    else:
+        if min_workers is not None:
+            process = limit_concurrency(process, AdaptiveConcurrency(min_workers, workers, max_latency=max_latency))
+        results = run_pipeline(sources, process, workers=workers, queue_size=queue_size)
 
     counter = 0
     start_time = datetime.utcnow()
     status = True
-    items = indexer.request_items(frameworks)
-    for result in mapper(indexer, items):
-        counter += 1
-        status = status and result
-        print_progress(counter, start_time)
+    label_counts, label_failures = collections.Counter(), collections.Counter()
+    try:
+        for (label, page_number), page_results in results:
+            for result in page_results:
+                counter += 1
+                status = status and result
+                print_progress(counter, start_time)
+                if label is not None:
+                    label_counts[label] += 1
+                    label_failures[label] += not result
+                    print_progress(label_counts[label], start_time, label)
+            if checkpoint is not None:
+                checkpoint.items_done(page_number, page_results)
+    finally:
+        # Keep the hashes of items sent before any interruption
+        if hashes is not None:
+            hashes.save()
+
+    for label, count in sorted(label_counts.items()):
+        logger.info("{label}: {count} items, {failed} failed", extra={
+            'label': label, 'count': count, 'failed': label_failures[label]
+        })
+
+    if checkpoint is not None:
+        # Items that failed before the reindex was resumed still count
+        status = status and not checkpoint.failed
+        checkpoint.finish()
+
+    # Changes made while indexing may have been missed, so the next run picks up from when this one started
+    if status and watermarks is not None:
+        watermarks.set(index, started_at)
 
     return status
@@ -0,0 +1,223 @@
+import random
+import threading
+import time
+
+DOS_FRAMEWORKS = (
+    'digital-outcomes-and-specialists', 'digital-outcomes-and-specialists-2', 'digital-outcomes-and-specialists-3'
+)
+G_CLOUD_FRAMEWORKS = ('g-cloud-8', 'g-cloud-9', 'g-cloud-10')
+DOS_LOTS = ('digital-outcomes', 'digital-specialists', 'user-research-studios', 'user-research-participants')
+G_CLOUD_LOTS = ('cloud-hosting', 'cloud-software', 'cloud-support')
+SPECIALIST_ROLES = ('agileCoach', 'businessAnalyst', 'deliveryManager', 'designer', 'developer', 'userResearcher')
+BRIEF_STATUSES = ('draft', 'live', 'closed', 'awarded', 'withdrawn', 'cancelled', 'unsuccessful')
+ORGANISATION_SIZES = ('micro', 'small', 'medium', 'large')
+MODELS = (
+    'users', 'services', 'briefs', 'brief_responses', 'direct_award_projects',
+    'direct_award_project_services', 'direct_award_project_searches',
+)
+
+
+class FakeDataAPIClient(object):
+    """A stand-in for DataAPIClient that serves generated models from `find_<model>_iter`, for benchmarking.
+
+    `scale` is the number of brief responses; the other models are generated in proportion to it. Models are
+    generated as they're iterated over rather than held in memory, and the same `scale` and `seed` always give the
+    same models.
+    """
+
+    def __init__(self, scale=10000, seed=1):
+        self.seed = seed
+        self.counts = {
+            'users': max(scale // 2, 1),
+            'services': scale,
+            'briefs': max(scale // 10, 1),
+            'brief_responses': scale,
+            'direct_award_projects': max(scale // 100, 1),
+        }
+
+    def find_users_iter(self, role=None, **kwargs):
+        return (user for user in self._models('users', self._user) if role is None or user['role'] == role)
+
+    def find_services_iter(self, framework=None, **kwargs):
+        frameworks = set(f.strip() for f in framework.split(',')) if framework else None
+        return (
+            service for service in self._models('services', self._service)
+            if frameworks is None or service['frameworkSlug'] in frameworks
+        )
+
+    def find_briefs_iter(self, **kwargs):
+        return self._models('briefs', self._brief)
+
+    def find_brief_responses_iter(self, status=None, **kwargs):
+        # Like the API, drafts are only listed if asked for
+        statuses = set(s.strip() for s in status.split(',')) if status else None
+        return (
+            response for response in self._models('brief_responses', self._brief_response)
+            if (response['status'] in statuses if statuses is not None else response['status'] != 'draft')
+        )
+
+    def find_direct_award_projects_iter(self, **kwargs):
+        return self._models('direct_award_projects', self._direct_award_project)
+
+    def find_direct_award_project_services_iter(self, project_id, **kwargs):
+        r = self._random('direct_award_project_services', project_id)
+        return iter([{'id': i, 'projectId': project_id} for i in range(1, r.randint(0, 30) + 1)])
+
+    def find_direct_award_project_searches_iter(self, project_id, **kwargs):
+        r = self._random('direct_award_project_searches', project_id)
+        return iter([{'id': i, 'projectId': project_id, 'active': i == 1} for i in range(1, r.randint(1, 4) + 1)])
+
+    def _models(self, model, generate):
+        return (generate(i, self._random(model, i)) for i in range(1, self.counts[model] + 1))
+
+    def _random(self, model, i):
+        # Seed each model separately, so it's the same however many of the other models are generated
+        return random.Random((self.seed * len(MODELS) + MODELS.index(model)) * 10 ** 9 + i)
+
+    def _user(self, i, r):
+        user = {
+            'id': i,
+            'name': 'User {}'.format(i),
+            'emailAddress': 'user{}@{}.gov.uk'.format(i, r.choice(('cabinet-office', 'hmrc', 'dwp', 'example'))),
+            'role': r.choice(('buyer', 'buyer', 'supplier', 'supplier', 'supplier', 'admin')),
+            'active': r.random() < 0.95,
+            'createdAt': _datetime(r),
+        }
+        if user['role'] == 'supplier':
+            user['supplier'] = {'supplierId': r.randint(1, self.counts['users']), 'name': 'Supplier'}
+        return user
+
+    def _service(self, i, r):
+        framework = r.choice(DOS_FRAMEWORKS + G_CLOUD_FRAMEWORKS)
+        supplier_id = r.randint(1, self.counts['users'])
+        service = {
+            'id': str(500000000000 + i),
+            'frameworkSlug': framework,
+            'lotSlug': r.choice(DOS_LOTS if framework in DOS_FRAMEWORKS else G_CLOUD_LOTS),
+            'serviceName': 'Service {}'.format(i),
+            'status': r.choice(('published', 'published', 'published', 'enabled', 'disabled')),
+            'supplierId': supplier_id,
+            'supplierName': 'Supplier {}'.format(supplier_id),
+        }
+        if service['lotSlug'] == 'digital-specialists':
+            for role in r.sample(SPECIALIST_ROLES, r.randint(1, 3)):
+                service[role + 'PriceMax'] = str(r.randint(300, 1500))
+        return service
+
+    def _brief(self, i, r):
+        status = r.choice(BRIEF_STATUSES)
+        lot = r.choice(('digital-outcomes', 'digital-specialists'))
+        brief = {
+            'id': i,
+            'title': 'Brief {}'.format(i),
+            'lot': lot,
+            'frameworkSlug': r.choice(DOS_FRAMEWORKS),
+            'status': status,
+            'organisation': 'Organisation {}'.format(r.randint(1, 500)),
+            'location': r.choice(('London', 'Scotland', 'Wales', 'North West England', 'Offsite')),
+            'users': [{'id': r.randint(1, self.counts['users']), 'emailAddress': 'buyer{}@example.gov.uk'.format(i)}],
+            'clarificationQuestions': [{'question': 'Q', 'answer': 'A'}] * r.randint(0, 5),
+            'createdAt': _datetime(r),
+            'isACopy': r.random() < 0.1,
+        }
+        if status != 'draft':
+            brief.update({
+                'publishedAt': _datetime(r),
+                'requirementsLength': r.choice(('1 week', '2 weeks', '')),
+                'contractLength': '{} months'.format(r.randint(1, 24)),
+                'budgetRange': '£{}'.format(r.randint(10, 500) * 1000),
+                'startDate': 'ASAP',
+            })
+        if lot == 'digital-specialists':
+            brief['specialistRole'] = r.choice(SPECIALIST_ROLES)
+        if status == 'awarded':
+            brief['awardedBriefResponseId'] = r.randint(1, self.counts['brief_responses'])
+        return brief
+
+    def _brief_response(self, i, r):
+        supplier_id = r.randint(1, self.counts['users'])
+        status = r.choice(('draft', 'submitted', 'submitted', 'submitted', 'awarded'))
+        brief_response = {
+            'id': i,
+            'briefId': r.randint(1, self.counts['briefs']),
+            'supplierId': supplier_id,
+            'supplierName': 'Supplier {}'.format(supplier_id),
+            'supplierOrganisationSize': r.choice(ORGANISATION_SIZES),
+            'status': status,
+            'createdAt': _datetime(r),
+            'essentialRequirements': [r.random() < 0.9 for _ in range(r.randint(1, 5))],
+            'brief': {'title': 'Brief', 'frameworkSlug': r.choice(DOS_FRAMEWORKS)},
+        }
+        if status != 'draft':
+            brief_response['submittedAt'] = _datetime(r)
+        if status == 'awarded':
+            brief_response['awardDetails'] = {
+                'awardedContractStartDate': '2018-{:02d}-01'.format(r.randint(1, 12)),
+                'awardedContractValue': str(r.randint(1, 1000) * 1000),
+            }
+        else:
+            brief_response['awardDetails'] = {}
+        return brief_response
+
+    def _direct_award_project(self, i, r):
+        locked = r.random() < 0.6
+        return {
+            'id': i,
+            'name': 'Project {}'.format(i),
+            'active': r.random() < 0.9,
+            'createdAt': _datetime(r),
+            'lockedAt': _datetime(r) if locked else None,
+            'downloadedAt': _datetime(r) if locked and r.random() < 0.5 else None,
+            'users': [{'id': r.randint(1, self.counts['users']), 'active': True}],
+        }
+
+
+class FakeSearchAPIClient(object):
+    """A stand-in for SearchAPIClient that keeps indexed documents in memory, for testing and benchmarking indexing.
+
+    Each request waits for `latency` seconds, to show the cost of making many requests. `bulk` takes a batch of
+    actions in one request, as `IndexerBase.index_items` describes.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.indexes = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def create_index(self, index, mapping):
+        self._request()
+        self.indexes.setdefault(index, {})
+        return {'message': 'acknowledged'}
+
+    def index(self, index, service_id, service, doc_type):
+        self._request()
+        self.indexes.setdefault(index, {})[service_id] = service
+        return {'message': 'acknowledged'}
+
+    def delete(self, index, service_id):
+        self._request()
+        self.indexes.setdefault(index, {}).pop(service_id, None)
+        return {'message': 'acknowledged'}
+
+    def bulk(self, index, actions):
+        self._request()
+        documents = self.indexes.setdefault(index, {})
+        for action in actions:
+            if action['action'] == 'index':
+                documents[action['id']] = action['document']
+            else:
+                documents.pop(action['id'], None)
+        return [{'id': action['id'], 'error': None} for action in actions]
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency)
+
+
+def _datetime(r):
+    return '20{:02d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}.{:06d}Z'.format(
+        r.randint(15, 18), r.randint(1, 12), r.randint(1, 28),
+        r.randint(0, 23), r.randint(0, 59), r.randint(0, 59), r.randint(0, 999999)
+    )
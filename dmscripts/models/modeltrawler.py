@@ -1,15 +1,20 @@
 import time
 import itertools
+import inspect
 import re
 import collections
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
 
 
 class ModelTrawler():
 
-    def __init__(self, model, client):
+    def __init__(self, model, client, prefetch=None, cache=None):
         self.start = time.time()
         self.client = client
         self.model = model
+        self.prefetch = prefetch
+        self.cache = cache
 
         model_iter_method = "find_{}_iter".format(self.model)
         if not isinstance(getattr(self.client, model_iter_method, None), collections.Callable):
@@ -20,23 +25,94 @@ class ModelTrawler():
             )
 
         self.model_iter_method = model_iter_method
+        self.model_page_method = "find_{}".format(self.model)
 
     def _get_allowed_models(self):
         r = re.compile('^find_(\w*)_iter$')
         return (r.match(attr).group(1) for attr in dir(self.client) if r.match(attr))
 
+    def supports_page_requests(self):
+        """Whether pages of this model can be requested by number, which prefetching and resuming rely on."""
+        try:
+            return 'page' in inspect.signature(getattr(self.client, self.model_page_method)).parameters
+        except (AttributeError, TypeError, ValueError):
+            return False
+
     def _model_iter(self, **kwargs):
-        for model in getattr(self.client, self.model_iter_method)(**kwargs):
+        if self.prefetch and self.supports_page_requests():
+            models = (model for result in self.iter_pages(**kwargs) for model in self.page_models(result))
+        else:
+            models = getattr(self.client, self.model_iter_method)(**kwargs)
+
+        for model in models:
             yield model
 
-    def _filter_keys(self, _keys=None):
+    def iter_pages(self, start_page=1, **kwargs):
+        """Yield each page of results from `start_page` onwards, in page order.
+
+        Up to `self.prefetch` pages are fetched in the background while the current page is being processed.
+        """
+        page_method = getattr(self.client, self.model_page_method)
+        depth = self.prefetch or 1
+        next_page = start_page + 1
 
-        def _get_nested_values(nested_keys, val):
+        with ThreadPoolExecutor(max_workers=depth) as executor:
+            # Wait for the first page to learn where the last page is before requesting any others
+            pending = collections.deque([executor.submit(page_method, page=start_page, **kwargs)])
             try:
-                return val if not len(nested_keys) else _get_nested_values(nested_keys, val[nested_keys.pop(0)])
+                while True:
+                    result = pending.popleft().result()
+                    if 'next' not in result.get('links', {}):
+                        yield result
+                        return
+
+                    # Request the next pages before handing this one over, so they're fetched while it's processed
+                    last_page = self._last_page_number(result)
+                    while len(pending) < depth and (last_page is None or next_page <= last_page):
+                        pending.append(executor.submit(page_method, page=next_page, **kwargs))
+                        next_page += 1
+
+                    yield result
+            finally:
+                # Don't wait on requests for pages we no longer need
+                for future in pending:
+                    future.cancel()
+
+    @staticmethod
+    def page_models(result):
+        # A page of results is the list of models alongside the 'links' and 'meta' of the response
+        return next((value for key, value in result.items() if key not in ('links', 'meta')), [])
+
+    @staticmethod
+    def _last_page_number(result):
+        last_page = parse_qs(urlparse(result.get('links', {}).get('last', '')).query).get('page')
+        return int(last_page[0]) if last_page else None
+
+    @staticmethod
+    def _compile_key(key):
+        """Return the output name for a key and a function that gets the key's value from a model dict.
+
+        Keys given as a list or tuple are a path into nested objects/arrays, named after their last element. Top
+        level keys have no function, as a plain `dict.get` is cheaper than calling one.
+        """
+        if not isinstance(key, (list, tuple)):
+            return key, None
+
+        def _get_nested_values(model_dict):
+            val = model_dict
+            try:
+                for nested_key in key:
+                    val = val[nested_key]
             except (KeyError, IndexError):
                 # objects/arrays might be empty for some returned models
                 return ''
+            return val
+
+        return key[len(key) - 1], _get_nested_values
+
+    def _filter_keys(self, _keys=None):
+        # Compile the keys once per trawl rather than walking each key spec for every model
+        getters = [self._compile_key(key) for key in _keys] if _keys is not None else None
 
         def _filter_keys_inner(model_dict):
             """Takes a python dictionary and strips out non-specified keys
@@ -60,27 +136,40 @@ class ModelTrawler():
 
             """
 
-            if _keys is None:
+            if getters is None:
                 return model_dict
 
-            filtered_dict = {}
-            for key in _keys:
-                if isinstance(key, (list, tuple)):
-                    filtered_dict[key[len(key) - 1]] = _get_nested_values(list(key), model_dict)
-                else:
-                    filtered_dict[key] = model_dict.get(key, '')
-
-            return filtered_dict
+            return {
+                name: model_dict.get(name, '') if getter is None else getter(model_dict)
+                for name, getter in getters
+            }
 
         return _filter_keys_inner
 
-    def get_data(self, keys=None, limit=None, **kwargs):
-        models = self._model_iter(**kwargs)
+    def _filtered_model_iter(self, keys=None, limit=None, **kwargs):
+        if self.cache is not None:
+            # The cache stores models with their keys already picked out
+            models = self.cache.get_models(self, keys, **kwargs)
+        else:
+            models = map(self._filter_keys(keys), self._model_iter(**kwargs))
 
         if limit is not None:
             models = itertools.islice(models, limit)
 
-        return list(map(self._filter_keys(keys), models))
+        return models
+
+    def get_data(self, keys=None, limit=None, **kwargs):
+        return list(self._filtered_model_iter(keys, limit, **kwargs))
+
+    def get_data_chunks(self, keys=None, chunk_size=1000, limit=None, **kwargs):
+        """Yield the filtered models in lists of at most `chunk_size`, so only one chunk is held in memory at once."""
+        models = self._filtered_model_iter(keys, limit, **kwargs)
+
+        while True:
+            chunk = list(itertools.islice(models, chunk_size))
+            if not chunk:
+                return
+            yield chunk
 
     def get_time_running(self):
         return time.time() - self.start
@@ -0,0 +1,202 @@
+import ast
+import re
+
+
+# Columns of each base model that the API can filter on, mapped to the `find_<model>` parameter that does so
+API_FILTER_PARAMS = {
+    'users': {'role': 'role'},
+}
+
+
+def plan_config(config, api_filter_params=API_FILTER_PARAMS):
+    """Return a copy of a get-model-data config that does the same work on fewer rows and columns.
+
+    - Parts of `filter_query` on columns that nothing changes before the filter are moved to `early_filter_query`,
+      which is applied as soon as the data is loaded. Parts that compare a column to a value the API can filter
+      on are moved to `get_data_kwargs` instead, so those rows are never fetched.
+    - Configs built from an earlier model's output get `load_columns`, the columns of that output they use.
+
+    Filters aren't moved in configs with joins, `get_by_model_fk` or `aggregation_counts`, as those steps change
+    the rows or columns the filter applies to. With `--limit`, filters moved to the API change which rows are kept.
+    """
+    config = dict(config)
+    referenced = referenced_columns(config)
+    if referenced is not None and 'model' in config and 'joins' not in config:
+        # Columns dropped from the left of a join would change which joined columns get suffixes
+        config['load_columns'] = sorted(referenced)
+
+    if not config.get('filter_query') or any(k in config for k in ('joins', 'get_by_model_fk', 'aggregation_counts')):
+        return config
+
+    changed = changed_columns(config)
+    api_params = api_filter_params.get(config.get('base_model'), {})
+    early, late = [], []
+
+    for condition in split_conjuncts(config['filter_query']):
+        columns = query_columns(condition)
+        if columns is None or columns & changed:
+            late.append(condition)
+            continue
+
+        column, value = _equality_with_value(condition)
+        if column in api_params and _is_fetched_as_is(config, column) \
+                and api_params[column] not in config['get_data_kwargs']:
+            config['get_data_kwargs'] = dict(config['get_data_kwargs'], **{api_params[column]: value})
+        else:
+            early.append(condition)
+
+    if early:
+        config['early_filter_query'] = ' and '.join(early)
+    if late:
+        config['filter_query'] = ' and '.join(late)
+    else:
+        del config['filter_query']
+
+    return config
+
+
+def explain(config):
+    """Return the steps `process_config` runs for a config, in order, as lines of text."""
+    steps = []
+
+    if 'base_model' in config:
+        steps.append('Fetch {} {} with {}'.format(
+            config['base_model'], _column_names(config['keys']), config['get_data_kwargs'] or 'no filters'
+        ))
+    elif 'model' in config:
+        steps.append('Load {}'.format(config['model']))
+    if 'load_columns' in config:
+        steps.append('Keep loaded columns {}'.format(config['load_columns']))
+    if 'early_filter_query' in config:
+        steps.append('Filter {}'.format(config['early_filter_query']))
+    for join in config.get('joins', []):
+        steps.append('Join {model_name} on {left_on} = {right_on}'.format(**join))
+    if 'get_by_model_fk' in config:
+        steps.append('Fetch {model_to_get} for each id'.format(**config['get_by_model_fk']))
+    for field in config.get('assign_json_subfields', {}):
+        steps.append('Assign {} subfields'.format(field))
+    for field, new_name in config.get('duplicate_fields', []):
+        steps.append('Copy {} to {}'.format(field, new_name))
+    if 'process_fields' in config:
+        steps.append('Process {}'.format(sorted(config['process_fields'])))
+    if 'add_counts' in config:
+        steps.append('Count {model_name} by {group_by}'.format(**config['add_counts']))
+    if 'aggregation_counts' in config:
+        steps.append('Count {}'.format([count['count_name'] for count in config['aggregation_counts']]))
+    if 'filter_query' in config:
+        steps.append('Filter {}'.format(config['filter_query']))
+    if 'group_by' in config:
+        steps.append('Group by {}'.format(config['group_by']))
+    steps.append('Keep columns {}'.format(_column_names(config['keys'])))
+    if 'sort_by' in config:
+        steps.append('Sort by {}'.format(config['sort_by']))
+    if config.get('drop_duplicates'):
+        steps.append('Drop duplicates')
+
+    return ['{}:'.format(config['name'])] + ['  {}. {}'.format(i, step) for i, step in enumerate(steps, 1)]
+
+
+def split_conjuncts(query):
+    """Split a query into the conditions that must all be true for it to be, or return it whole if it isn't `and`s."""
+    parts = re.split(r'\s+and\s+', query.strip())
+    try:
+        tree = ast.parse(query.strip(), mode='eval').body
+        if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And) and len(tree.values) == len(parts) and all(
+            ast.dump(ast.parse(part, mode='eval').body) == ast.dump(value) for part, value in zip(parts, tree.values)
+        ):
+            return parts
+    except SyntaxError:
+        pass
+
+    return [query]
+
+
+def query_columns(query):
+    """Return the names of the columns a query refers to, or None if they can't be told."""
+    try:
+        tree = ast.parse(query.strip(), mode='eval')
+    except SyntaxError:
+        # e.g. queries using `@` to refer to local variables
+        return None
+
+    if any(isinstance(node, (ast.Call, ast.Attribute, ast.Subscript)) for node in ast.walk(tree)):
+        return None
+
+    return set(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+
+
+def changed_columns(config):
+    """Return the columns the steps before `filter_query` add or change, other than by a join."""
+    changed = set(config.get('process_fields', {}))
+    for subfields in config.get('assign_json_subfields', {}).values():
+        changed.update(subfields)
+    changed.update(new_name for _, new_name in config.get('duplicate_fields', []))
+    if 'add_counts' in config:
+        # Count columns are named `<group_by>-<value>`
+        changed.update(
+            column for column in _column_names(config['keys'])
+            if column.startswith('{}-'.format(config['add_counts']['group_by']))
+        )
+
+    return changed
+
+
+def referenced_columns(config):
+    """Return every column name a config refers to, or None if some can't be told."""
+    columns = set(_column_names(config['keys']))
+    columns.update(config.get('rename_fields', {}))
+    columns.update(_as_list(config.get('sort_by', [])))
+    columns.update(_as_list(config.get('group_by', [])))
+    columns.update(config.get('process_fields', {}))
+    for field, subfields in config.get('assign_json_subfields', {}).items():
+        columns.add(field)
+        columns.update(subfields)
+    for field, new_name in config.get('duplicate_fields', []):
+        columns.update([field, new_name])
+    for join in config.get('joins', []):
+        columns.add(join['left_on'])
+    if 'add_counts' in config:
+        columns.add(config['add_counts']['join'][0])
+
+    queries = [config.get('filter_query'), config.get('early_filter_query')]
+    for count in config.get('aggregation_counts', []):
+        columns.update([count['group_by'], count['join'][0], count['count_name']])
+        queries.append(count.get('query'))
+    if 'get_by_model_fk' in config:
+        columns.add('id')
+        queries.append(config['get_by_model_fk'].get('filter_before_request_query'))
+
+    for query in filter(None, queries):
+        query_names = query_columns(query)
+        if query_names is None:
+            return None
+        columns.update(query_names)
+
+    return columns
+
+
+def _equality_with_value(condition):
+    """Return the column and value of a `column == 'value'` condition, or (None, None) for other conditions."""
+    tree = ast.parse(condition.strip(), mode='eval').body
+    if not (isinstance(tree, ast.Compare) and len(tree.ops) == 1 and isinstance(tree.ops[0], ast.Eq)):
+        return None, None
+
+    left, right = tree.left, tree.comparators[0]
+    if isinstance(left, ast.Str):
+        left, right = right, left
+    if isinstance(left, ast.Name) and isinstance(right, ast.Str):
+        return left.id, right.s
+
+    return None, None
+
+
+def _is_fetched_as_is(config, column):
+    return 'base_model' in config and column in config['keys']
+
+
+def _column_names(keys):
+    return [key[-1] if isinstance(key, (tuple, list)) else key for key in keys]
+
+
+def _as_list(columns):
+    return [columns] if isinstance(columns, str) else list(columns)
@@ -1,11 +1,35 @@
+import re
 from datetime import datetime
+
+import pandas
 from dmutils.formats import DATE_FORMAT, DATETIME_FORMAT
 
 
+# Strings `format_datetime_string_as_date` accepts, as `DATETIME_FORMAT` does, capturing the date
+DATETIME_STRING_DATE = re.compile(
+    r'^(\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01]))T(?:[01]\d|2[0-3]):[0-5]\d:(?:[0-5]\d|6[01])\.\d{1,6}Z$'
+)
+
+
 def format_datetime_string_as_date(dt):
     return datetime.strptime(dt, DATETIME_FORMAT).strftime(DATE_FORMAT) if dt else None
 
 
+def format_datetime_strings_as_dates(values):
+    """Vectorised `format_datetime_string_as_date` for a Series of strings."""
+    present = values.astype(bool)
+    dates = values[present].str.extract(DATETIME_STRING_DATE, expand=False)
+    if dates.isnull().any():
+        raise ValueError("Values don't match {}".format(DATETIME_FORMAT))
+
+    # Check the dates exist, e.g. that there's no 30th of February. Raises a ValueError if not.
+    pandas.to_datetime(dates, format=DATE_FORMAT)
+
+    result = pandas.Series([None] * len(values), index=values.index, dtype=object)
+    result[present] = dates
+    return result
+
+
 def remove_username_from_email_address(ea):
     return '{}'.format(ea.split('@').pop()) if ea else None
 
@@ -19,3 +43,11 @@ def construct_brief_url(brief_id):
 
 def extract_id_from_user_info(user_data):
     return ','.join([str(user['id']) for user in user_data])
+
+
+# Rules with an implementation that processes a whole column at once. The implementation raises a ValueError,
+# TypeError or AttributeError for values it can't handle exactly as the rule would, and the rule is then applied
+# to each value instead.
+VECTORISED_RULES = {
+    format_datetime_string_as_date: format_datetime_strings_as_dates,
+}
@@ -1,10 +1,18 @@
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas
 
-from dmscripts.models.writecsv import csv_path
+from dmscripts.models.process_rules import VECTORISED_RULES
+from dmscripts.models.writecsv import read_data
 from dmscripts.models.modeltrawler import ModelTrawler
 
 
-def base_model(base_model, keys, get_data_kwargs, client, logger=None, limit=None):
+def base_model(
+    base_model, keys, get_data_kwargs, client, logger=None, limit=None, prefetch=None, chunk_size=None, cache=None,
+    dtypes=None
+):
     """Fetch all the data for a given Digital Marketplace model from the api.
 
     :param base_model: A Digital Marketplace model (client must have a 'find_{model}_iter' method)
@@ -13,29 +21,55 @@ def base_model(base_model, keys, get_data_kwargs, client, logger=None, limit=Non
     :param client: Instantiated Digital Marketplace APIClient
     :param logger:
     :param limit: Maximum number of requests for the client to perform.
+    :param prefetch: Number of pages to fetch ahead of the page being processed. Pages are fetched one at a time
+                     if not set.
+    :param chunk_size: If set, build the DataFrame from chunks of this many rows as they are fetched rather than from
+                       a list of every row, so the full set of raw rows is never held in memory alongside the frame.
+    :param cache: An optional RawModelCache to read the models from, fetching only new models from the API.
+    :param dtypes: An optional dict of column name to dtype, e.g. 'category' for columns with few distinct values.
     :return: A pandas DataFrame of the requested data. Columns as model attributes, rows as instances.
     """
-    mt = ModelTrawler(base_model, client)
-    data = list(mt.get_data(keys=keys, limit=limit, **get_data_kwargs))
+    mt = ModelTrawler(base_model, client, prefetch=prefetch, cache=cache)
+    if chunk_size:
+        frames = [
+            pandas.DataFrame(chunk)
+            for chunk in mt.get_data_chunks(keys=keys, chunk_size=chunk_size, limit=limit, **get_data_kwargs)
+        ]
+        data = pandas.concat(frames, ignore_index=True) if frames else pandas.DataFrame(columns=keys)
+    else:
+        rows = mt.get_data(keys=keys, limit=limit, **get_data_kwargs)
+        data = pandas.DataFrame(rows) if rows else pandas.DataFrame(columns=keys)
+
+    if dtypes:
+        # Set after concatenating chunks, as categoricals with different categories are concatenated as objects
+        data = data.astype({column: dtype for column, dtype in dtypes.items() if column in data})
+
     if logger:
         logger.info(
             '{} {} returned after {}s'.format(len(data), base_model, mt.get_time_running())
         )
 
-    return pandas.DataFrame(data) if data else pandas.DataFrame(columns=keys)
+    return data
 
 
-def model(model, directory):
+def model(model, directory, registry=None, data_format='csv'):
     """Return a Pandas DataFrame loaded from a csv of a given DM model.
 
     :param model: The model we are working with, used as the name of the .csv
     :param directory: The directory in which to find the model data csv.
+    :param registry: An optional FrameRegistry to take the model data from, if it holds it, instead of the csv.
+    :param data_format: The format the model data was written in, if not csv. See `writecsv.DATA_FORMATS`.
     :return: Pandas DataFrame of model data loaded from csv.
     """
-    return pandas.read_csv(csv_path(directory, model))
+    data = registry.get(model) if registry is not None else None
 
+    return data if data is not None else read_data(directory, model, data_format)
 
-def join(data, model_name, left_on, right_on, directory, how='left', data_duplicate_suffix=None):
+
+def join(
+    data, model_name, left_on, right_on, directory, how='left', data_duplicate_suffix=None, registry=None,
+    data_format='csv'
+):
     """Left join the model data csv denoted by 'model' to 'data'.
 
     :param data: The current pandas DataFrame we are working with.
@@ -45,16 +79,42 @@ def join(data, model_name, left_on, right_on, directory, how='left', data_duplic
     :param directory: The data directory.
     :param how: The type of merge to use. Defaults to 'left'. Can also be 'right', 'inner' or 'outer'.
     :param data_duplicate_suffix: An optional suffix for fields duplicated in both datasets.
+    :param registry: An optional FrameRegistry to take the model data from.
+    :param data_format: The format the model data was written in, if not csv.
     :return: pandas DataFrame of model joined to data.
     """
-    csv_to_be_joined = model(model_name, directory)
+    csv_to_be_joined = model(model_name, directory, registry=registry, data_format=data_format)
     return data.merge(
         csv_to_be_joined,
         how=how,
         left_on=left_on,
         right_on=right_on,
         suffixes=[data_duplicate_suffix, '_' + model_name]
-    ).fillna('')
+    ).pipe(_fill_blanks)
+
+
+def _fill_blanks(data):
+    """Replace missing values with '', adding '' to the categories of categorical columns that need it."""
+    categorical = data.select_dtypes(include='category').columns
+    if categorical.empty:
+        return data.fillna('')
+
+    # Categorical columns can only be filled with one of their categories, even where there's nothing to fill
+    columns_to_fill = [column for column in data.columns if column not in categorical]
+    for column in categorical:
+        values = data[column]
+        if not values.isnull().any():
+            continue
+
+        if '' not in values.cat.categories:
+            try:
+                # Keep the categories sorted, so sorting by the column still sorts by value
+                data[column] = values.cat.set_categories(sorted(values.cat.categories.tolist() + ['']))
+            except TypeError:
+                data[column] = values.astype(object)
+        columns_to_fill.append(column)
+
+    return data.fillna({column: '' for column in columns_to_fill})
 
 
 def filter_rows(filter_query, data):
@@ -68,12 +128,27 @@ def filter_rows(filter_query, data):
 
 
 def process_fields(rules, data):
+    """Replace the values of each field with the result of its rule.
+
+    Rules in `process_rules.VECTORISED_RULES` are applied to the whole column at once where they can be.
+    """
     for field, fn in rules.items():
-        data[field] = data[field].apply(fn)
+        data[field] = _apply_rule(fn, data[field])
 
     return data
 
 
+def _apply_rule(fn, values):
+    vectorised = VECTORISED_RULES.get(fn)
+    if vectorised is not None:
+        try:
+            return vectorised(values)
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+    return values.apply(fn)
+
+
 def rename_fields(columns, data):
     """Replace any column names using a dict of 'old column name': 'new column name' """
     return data.rename(columns=columns)
@@ -84,20 +159,32 @@ def sort_by(columns, data):
 
 
 def group_by(columns, data):
-    return data.groupby(columns).size().reset_index(name='count')
+    return data.groupby(columns, observed=True).size().reset_index(name='count')
 
 
-def add_counts(join, group_by, model_name, data, directory):
-    left_on, right_on = join
-    count_data = model(model_name, directory).groupby(
-        [right_on, group_by]
-    ).size().reset_index(name='_count')
+def add_counts(join, group_by, model_name, data, directory, registry=None, data_format='csv'):
+    """Add a `<group_by>-<value>` column to `data` for each `group_by` value in the model, counting its rows.
 
-    for group in count_data[group_by].unique():
-        data["{}-{}".format(group_by, group)] = data.merge(
-            count_data[count_data[group_by] == group],
-            left_on=left_on, right_on=right_on, how='left'
-        )['_count'].fillna(0)
+    Counts for rows of `data` with no matching rows are 0.
+    """
+    left_on, right_on = join
+    counts = model(model_name, directory, registry=registry, data_format=data_format).groupby(
+        [right_on, group_by], observed=True
+    ).size()
+    if counts.empty:
+        return data
+
+    # Count every group in one table, so it can be joined to `data` with a single merge
+    groups = counts.index.get_level_values(group_by).unique()
+    count_table = counts.unstack(group_by).reindex(columns=groups)
+    count_table.columns = ["{}-{}".format(group_by, group) for group in groups]
+
+    count_columns = data[[left_on]].merge(count_table, left_on=left_on, right_index=True, how='left')
+    for column in count_table.columns:
+        counts = count_columns[column]
+        # Keep integer counts when every row has a match, as merging a single group's counts did
+        counts = counts.fillna(0) if counts.isnull().any() else counts.astype('int64')
+        data[column] = counts.values
 
     return data
 
@@ -114,17 +201,82 @@ def add_aggregation_counts(data, group_by, join, count_name, query=None):
     """
     left_on, right_on = join
 
-    count_data = (data.query(query) if query else data).groupby(group_by)[group_by].count()
+    count_data = (data.query(query) if query else data).groupby(group_by, observed=True)[group_by].count()
     count_data_frame = pandas.DataFrame({group_by: count_data.index, count_name: count_data})
 
     data = data.merge(count_data_frame, how='left', left_on=left_on, right_on=right_on, suffixes=['', count_name])
     return data
 
 
+def add_all_aggregation_counts(data, counts):
+    """Add several aggregated counts to a pandas DataFrame as new columns, as `add_aggregation_counts` would.
+
+    Counts grouped and joined by the same column are all computed in one grouped pass over `data` and added with
+    one merge. Otherwise each count is added in turn.
+
+    :param data: The DataFrame to apply the new columns to.
+    :param counts: A list of kwargs for `add_aggregation_counts`.
+    :return: pandas DataFrame with new count columns.
+    """
+    if not _can_fuse_aggregation_counts(data, counts):
+        for count in counts:
+            data = add_aggregation_counts(data=data, **count)
+        return data
+
+    group_by = counts[0]['group_by']
+    count_names = [count['count_name'] for count in counts]
+
+    # Count each query's matching rows as the sum of a mask, so every count comes from one groupby
+    masks = pandas.DataFrame(OrderedDict(
+        (count['count_name'], (data.eval(count['query']) if count.get('query') else True))
+        for count in counts
+    ), index=data.index, columns=count_names).astype('int64')
+    count_data = masks.groupby(data[group_by], observed=True).sum()
+    # A group with no rows matching a query would have been missing from that count's rows, so isn't counted
+    count_data = count_data.where(count_data != 0).reset_index()
+
+    data = data.merge(count_data, how='left', on=group_by)
+    for count_name in count_names:
+        if not data[count_name].isnull().any():
+            data[count_name] = data[count_name].astype('int64')
+
+    return data
+
+
+def _can_fuse_aggregation_counts(data, counts):
+    count_names = [count['count_name'] for count in counts]
+
+    return (
+        len(set((count['group_by'], tuple(count['join'])) for count in counts)) == 1 and
+        tuple(counts[0]['join']) == (counts[0]['group_by'], counts[0]['group_by']) and
+        len(set(count_names)) == len(count_names) and
+        not set(count_names) & set(data.columns) and
+        # Queries can't refer to counts added before them
+        not any(_query_refers_to(count.get('query'), name) for name in count_names for count in counts)
+    )
+
+
+def _query_refers_to(query, column):
+    if not query:
+        return False
+
+    query_without_strings = re.sub(r'"[^"]*"|\'[^\']*\'', '', query)
+    return re.search(r'\b{}\b'.format(re.escape(column)), query_without_strings) is not None
+
+
 def assign_json_subfields(field, subfields, data):
-    """Apply subfields from field to data."""
-    for subfield in subfields:
-        data[subfield] = data.apply(lambda row: row[field].get(subfield, '') if row[field] else '', axis=1)
+    """Apply subfields from field to data.
+
+    Subfields missing from a value, or of an empty value, are set to ''.
+    """
+    subfields = list(subfields)
+    # Read every subfield of each value in one pass over the column, rather than a row-wise `apply` per subfield
+    blank = [''] * len(subfields)
+    rows = [[value.get(subfield, '') for subfield in subfields] if value else blank for value in data[field]]
+    columns = list(zip(*rows)) if rows else [()] * len(subfields)
+
+    for subfield, column in zip(subfields, columns):
+        data[subfield] = list(column)
     return data
 
 
@@ -137,19 +289,30 @@ def duplicate_fields(data, field, new_field_name):
     return data
 
 
-def get_by_model_fk(config, keys, data, client):
+def get_by_model_fk(config, keys, data, client, workers=1):
+    """Fetch the `model_to_get` models for each id in `data`, passing the id as the `fk_column_name` kwarg.
+
+    :param workers: Number of models to fetch at once. Results are returned in the order of the ids either way.
+    :return: A pandas DataFrame of the fetched models.
+    """
     model = config['model_to_get']
     fk_column_name = config['fk_column_name']
     kwargs = config['get_data_kwargs']
 
-    return_data_frame = pandas.DataFrame()
-
     if config.get('filter_before_request_query'):
         data = data.query(config['filter_before_request_query']).reset_index(drop=True)
-    for id_value in data['id']:
+
+    def get_models(id_value):
         get_data_kwargs = kwargs.copy()
         get_data_kwargs.update({fk_column_name: id_value})
-        model_data = base_model(model, keys, get_data_kwargs, client)
-        return_data_frame = return_data_frame.append(model_data, ignore_index=True)
+        return base_model(model, keys, get_data_kwargs, client)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frames = list(executor.map(get_models, data['id']))
+    else:
+        frames = [get_models(id_value) for id_value in data['id']]
 
-    return pandas.DataFrame(columns=keys) if return_data_frame.empty else return_data_frame
+    # Concatenate once at the end, as appending each frame in turn copies every row fetched so far
+    frames = [frame for frame in frames if not frame.empty]
+    return pandas.concat(frames, ignore_index=True) if frames else pandas.DataFrame(columns=keys)
@@ -0,0 +1,172 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from dmapiclient import HTTPError
+
+
+class RawModelCache(object):
+    """A local store of the keyed fields of models returned by the API, keyed by model name, request kwargs and keys.
+
+    Once a model has been fetched in full, later runs only fetch from the page holding the last stored model onwards
+    and add the result to the store. This only picks up new models, provided the API lists them in the order they
+    were created, so resuming is only safe for models whose stored records don't change, or where changes to them
+    don't matter, such as the records of an `incremental` get-model-data config up to its watermark. Changes to models
+    on earlier pages are only picked up by a full fetch, which happens when `resume` is False, when the store is older
+    than `max_age` seconds or when the stored models don't match the total count reported by the API.
+
+    Each store is a `.jsonl` file of `[id, model]` lines with a `.json` file of details alongside it. Models are read
+    and written a line at a time as they're iterated over, so a store is never held in memory as a whole.
+    """
+
+    def __init__(self, directory, max_age=None, logger=None, resume=True):
+        self.directory = directory
+        self.max_age = max_age
+        self.logger = logger
+        self.resume = resume
+        self._locks = defaultdict(threading.Lock)
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def refreshing(self):
+        """Return a cache of the same stores that always fetches models in full, bringing the stores up to date."""
+        cache = RawModelCache(self.directory, max_age=self.max_age, logger=self.logger, resume=False)
+        cache._locks = self._locks
+        return cache
+
+    def path(self, model, kwargs, keys=None):
+        """Return the path of a store, without the `.jsonl` or `.json` extension."""
+        request_hash = hashlib.sha1(json.dumps([kwargs, keys], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.directory, '{}-{}'.format(model, request_hash))
+
+    def get_models(self, trawler, keys=None, **kwargs):
+        """Yield the `keys` of every model for `trawler.model`, as `ModelTrawler.get_data` would, refreshing the store
+        from the API first. The store is only updated once every model has been yielded.
+        """
+        path = self.path(trawler.model, kwargs, keys)
+        filter_keys = trawler._filter_keys(keys)
+
+        # Configs sharing a model and kwargs may be fetched concurrently; let the second reuse the first's work
+        with self._locks[path]:
+            details = self._load_details(path)
+
+            new_models = None
+            if self.resume and details and self._is_resumable(path, details, trawler):
+                new_models = self._fetch_new_models(path, trawler, details, kwargs, filter_keys)
+
+            if new_models is None:
+                self._log("Fetching all {model} to cache in {path}", model=trawler.model, path=path)
+                details = {'page_size': None, 'fully_fetched_at': time.time()}
+                models = self._fetch_all_models(trawler, kwargs, filter_keys, details)
+            else:
+                models = self._stored_models(path, details, new_models)
+
+            count = 0
+            with open(path + '.jsonl.tmp', 'w') as f:
+                for model_id, model in models:
+                    f.write(json.dumps([model_id, model]) + '\n')
+                    count += 1
+                    yield model
+
+            # If interrupted before the details are saved, their count only covers the first of the new models, which
+            # is still a consistent store to resume from
+            os.replace(path + '.jsonl.tmp', path + '.jsonl')
+            details.update({
+                'model': trawler.model, 'kwargs': kwargs, 'keys': keys, 'fetched_at': time.time(), 'count': count
+            })
+            self._save_details(path, details)
+
+    def _is_resumable(self, path, details, trawler):
+        if self.max_age is not None and time.time() - details['fully_fetched_at'] > self.max_age:
+            return False
+
+        return bool(details['page_size'] and details['count']) and os.path.exists(path + '.jsonl') and \
+            trawler.supports_page_requests()
+
+    def _fetch_all_models(self, trawler, kwargs, filter_keys, details):
+        if not trawler.supports_page_requests():
+            for model in getattr(trawler.client, trawler.model_iter_method)(**kwargs):
+                yield model['id'], filter_keys(model)
+            return
+
+        for result in trawler.iter_pages(**kwargs):
+            page = trawler.page_models(result)
+            details['page_size'] = details['page_size'] or len(page)
+            for model in page:
+                yield model['id'], filter_keys(model)
+
+    def _start_page(self, details):
+        # The last stored page may have been partly filled, so fetch it again
+        return (details['count'] - 1) // details['page_size'] + 1
+
+    def _fetch_new_models(self, path, trawler, details, kwargs, filter_keys):
+        """Return the models from the last stored page onwards, or None if a full fetch is needed."""
+        start_page = self._start_page(details)
+        models = []
+        total = None
+
+        try:
+            for result in trawler.iter_pages(start_page=start_page, **kwargs):
+                total = total if total is not None else result.get('meta', {}).get('total')
+                models.extend((model['id'], filter_keys(model)) for model in trawler.page_models(result))
+        except HTTPError as e:
+            # The API returns a 404 for pages past the end, which means models have been removed
+            if e.status_code != 404:
+                raise
+            self._log(
+                "Cached {model} no longer match the API (page {page} not found)", model=trawler.model, page=start_page
+            )
+            return None
+
+        stored = (start_page - 1) * details['page_size']
+        # Models only ever added to the end leave the last stored page as it was, with the same total before it
+        with open(path + '.jsonl') as f:
+            last_page_ids = [json.loads(line)[0] for line in itertools.islice(f, stored, None)]
+        if [model_id for model_id, model in models[:len(last_page_ids)]] != last_page_ids or \
+                total is not None and total != stored + len(models):
+            self._log(
+                "Cached {model} no longer match the API ({count} cached, {total} in API)",
+                model=trawler.model, count=stored + len(models), total=total
+            )
+            return None
+
+        self._log(
+            "Fetched {new} new {model} from page {page} onwards",
+            new=stored + len(models) - details['count'], model=trawler.model, page=start_page
+        )
+        return models
+
+    def _stored_models(self, path, details, new_models):
+        """Yield the stored models before the last stored page, then `new_models`, which replace any with their ids."""
+        new_ids = set(model_id for model_id, model in new_models)
+
+        with open(path + '.jsonl') as f:
+            for line in itertools.islice(f, (self._start_page(details) - 1) * details['page_size']):
+                model_id, model = json.loads(line)
+                if model_id not in new_ids:
+                    yield model_id, model
+
+        for new_model in new_models:
+            yield new_model
+
+    def _load_details(self, path):
+        if not os.path.exists(path + '.json'):
+            return None
+
+        with open(path + '.json') as f:
+            return json.load(f)
+
+    def _save_details(self, path, details):
+        # Write to a temporary file first so an interrupted run can't leave truncated details behind
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump(details, f)
+        os.replace(path + '.json.tmp', path + '.json')
+
+    def _log(self, message, **kwargs):
+        if self.logger:
+            self.logger.info(message.format(**kwargs))
@@ -0,0 +1,42 @@
+import threading
+
+
+class FrameRegistry(object):
+    """Keeps the output DataFrame of each config in memory, so later configs don't each have to read it back from disk.
+
+    Frames should be added as they're read back from the file they were written to, with the types that gives them, so
+    configs built from them give the same output whether they take them from here or read the file themselves.
+    """
+
+    def __init__(self, keep=None):
+        """
+        :param keep: Names of the frames that later configs will read. Other frames aren't held, to save memory.
+                     All frames are held if not set.
+        """
+        self.keep = keep
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def keeps(self, name):
+        """Whether a frame of this name would be held if it were added."""
+        return self.keep is None or name in self.keep
+
+    def add(self, name, data):
+        if not self.keeps(name):
+            return
+
+        # Give the frame the same index it would have if it were read from a CSV
+        with self._lock:
+            self._frames[name] = data.reset_index(drop=True)
+
+    def get(self, name):
+        """Return a copy of the named frame, or None if it isn't held."""
+        with self._lock:
+            data = self._frames.get(name)
+
+        # Steps modify the frames they're given, so each reader gets its own copy
+        return data.copy() if data is not None else None
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._frames
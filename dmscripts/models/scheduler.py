@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def config_dependencies(config):
+    """Return the names of the models a config reads from earlier output, via its `model`, `joins` and `add_counts`."""
+    dependencies = set()
+
+    if 'model' in config:
+        dependencies.add(config['model'])
+    for join in config.get('joins', []):
+        dependencies.add(join['model_name'])
+    if 'add_counts' in config:
+        dependencies.add(config['add_counts']['model_name'])
+
+    return dependencies
+
+
+def dependency_graph(configs):
+    """Map each config name to the names of the other configs in `configs` it depends on.
+
+    Dependencies on models that aren't in `configs` are left out, as their output must already exist.
+    """
+    names = set(config['name'] for config in configs)
+    return {config['name']: config_dependencies(config) & names for config in configs}
+
+
+def run_configs(configs, process_config, workers=1):
+    """Call `process_config` for each config, running up to `workers` at once.
+
+    A config starts as soon as every config it depends on has finished. With a single worker the configs are run
+    in the order given. If a config fails no new ones are started, and the error is raised once running ones finish.
+    """
+    graph = dependency_graph(configs)
+
+    if workers <= 1:
+        for config in configs:
+            process_config(config)
+        return
+
+    waiting = list(configs)
+    finished = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while waiting or running:
+            ready = [config for config in waiting if graph[config['name']] <= finished]
+            for config in ready:
+                waiting.remove(config)
+                running[executor.submit(process_config, config)] = config['name']
+
+            if not running:
+                raise ValueError(
+                    "Circular dependencies between configs: {}".format(', '.join(c['name'] for c in waiting))
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    wait(running)
+                    raise future.exception()
+                finished.add(name)
@@ -0,0 +1,72 @@
+import json
+import threading
+from collections import defaultdict, OrderedDict
+
+
+def base_model_keys(config):
+    """Return the keys to fetch for a config's `base_model`: its `keys`, and the fields of `assign_json_subfields`."""
+    return list(config['keys']) + list(config.get('assign_json_subfields', {}).keys())
+
+
+def fetch_key(config):
+    return config['base_model'], json.dumps([config['get_data_kwargs'], config.get('dtypes')], sort_keys=True)
+
+
+class SharedFetches(object):
+    """Fetches the base model data of configs with the same `base_model`, `get_data_kwargs` and `dtypes` once.
+
+    The shared fetch gets every key any of those configs needs, and each config is given a copy of just its own
+    columns. The fetched data is let go once every config sharing it has had its copy.
+    """
+
+    def __init__(self, configs):
+        groups = OrderedDict()
+        for config in configs:
+            if 'base_model' in config:
+                groups.setdefault(fetch_key(config), []).append(config)
+
+        self._keys = {}
+        self._remaining = {}
+        for key, group in groups.items():
+            keys = _union_keys(base_model_keys(config) for config in group)
+            # Configs fetching different values under the same column name can't share
+            if len(group) > 1 and keys is not None:
+                self._keys[key] = keys
+                self._remaining[key] = len(group)
+
+        self._frames = {}
+        self._locks = defaultdict(threading.Lock)
+
+    def is_shared(self, config):
+        return 'base_model' in config and fetch_key(config) in self._keys
+
+    def get(self, config, fetch):
+        """Return the base model data for a config, calling `fetch(keys)` to fetch it if it hasn't been already."""
+        if not self.is_shared(config):
+            return fetch(base_model_keys(config))
+
+        key = fetch_key(config)
+        with self._locks[key]:
+            if key not in self._frames:
+                self._frames[key] = fetch(self._keys[key])
+            data = self._frames[key]
+
+            self._remaining[key] -= 1
+            if not self._remaining[key]:
+                del self._frames[key]
+
+        return data.reindex(columns=_column_names(base_model_keys(config)))
+
+
+def _union_keys(key_lists):
+    keys = OrderedDict()
+    for key in (key for key_list in key_lists for key in key_list):
+        name = _column_names([key])[0]
+        if keys.setdefault(name, key) != key:
+            return None
+
+    return list(keys.values())
+
+
+def _column_names(keys):
+    return [key[-1] if isinstance(key, (tuple, list)) else key for key in keys]
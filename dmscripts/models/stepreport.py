@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+import time
+
+
+def current_memory():
+    """Return the resident memory of this process in bytes, or None where /proc isn't available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, IOError, ValueError):
+        return None
+
+
+class StepReport(object):
+    """Records the rows in and out, time taken and change in memory of each step run for each config.
+
+    Memory is the resident memory of the whole process, so when configs are processed at once their steps' memory
+    deltas include each other's allocations.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def recorder(self, config_name):
+        """Return a StepRecorder for a config, timing its first step from now."""
+        return StepRecorder(self, config_name)
+
+    def add(self, step):
+        with self._lock:
+            self.steps.append(step)
+
+    def totals(self):
+        """Return the total seconds taken by each step, summed across configs, slowest first."""
+        totals = {}
+        for step in self.steps:
+            totals[step['step']] = totals.get(step['step'], 0) + step['seconds']
+
+        return sorted(((step, round(seconds, 3)) for step, seconds in totals.items()), key=lambda t: -t[1])
+
+    def write(self, path, **details):
+        with open(path, 'w') as f:
+            json.dump(dict(details, steps=self.steps, totals=dict(self.totals())), f, indent=2)
+
+
+class StepRecorder(object):
+    """Records the steps of one config, each one measured from the end of the step before it."""
+
+    def __init__(self, report, config_name):
+        self.report = report
+        self.config_name = config_name
+        self._rows = None
+        self._start = time.perf_counter()
+        self._memory = current_memory()
+
+    def record(self, step, data):
+        """Record that `step` has finished with `data` as its output."""
+        end, memory = time.perf_counter(), current_memory()
+        self.report.add({
+            'config': self.config_name,
+            'step': step,
+            'rows_in': self._rows,
+            'rows_out': len(data),
+            'seconds': round(end - self._start, 4),
+            'memory_delta_mb': round((memory - self._memory) / 2 ** 20, 1) if None not in (memory, self._memory)
+            else None,
+        })
+        self._start, self._memory, self._rows = end, memory, len(data)
@@ -0,0 +1,44 @@
+import json
+import os
+import threading
+
+
+class Watermarks(object):
+    """How far each named export has got, kept in `<directory>/<filename>`: the highest value of each incremental
+    get-model-data config's watermark column, or the time of each index's last successful reindex.
+
+    Also tracks which configs have changed their output in this run, so configs built from unchanged models can be
+    skipped.
+    """
+
+    def __init__(self, directory, filename='.watermarks.json'):
+        self.path = os.path.join(directory, filename)
+        self._changed = set()
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self._values = json.load(f)
+        else:
+            self._values = {}
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name)
+
+    def set(self, name, value):
+        """Save a config's watermark, which `value` may be a numpy scalar of."""
+        with self._lock:
+            self._values[name] = value.item() if hasattr(value, 'item') else value
+            # Write to a temporary file first so an interrupted run can't leave a truncated file behind
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self._values, f, indent=2, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
+
+    def mark_changed(self, name):
+        with self._lock:
+            self._changed.add(name)
+
+    def any_changed(self, names):
+        with self._lock:
+            return bool(self._changed & set(names))
@@ -1,5 +1,89 @@
 import os
 
+import pandas
+
+
+DATA_FORMATS = ('csv', 'parquet')
+
 
 def csv_path(output_dir, _filename):
-    return os.path.join(output_dir, '{}.csv'.format(_filename))
+    return data_path(output_dir, _filename, 'csv')
+
+
+def data_path(output_dir, _filename, data_format='csv'):
+    return os.path.join(output_dir, '{}.{}'.format(_filename, data_format))
+
+
+def write_data(data, output_dir, _filename, data_format='csv'):
+    """Write a DataFrame to `<output_dir>/<_filename>.<data_format>` and return the path written to."""
+    filename = data_path(output_dir, _filename, data_format)
+
+    if data_format == 'parquet':
+        _columnar_compatible(data).to_parquet(filename, engine='pyarrow')
+    else:
+        data.to_csv(filename, index=False, encoding='utf-8')
+
+    return filename
+
+
+def append_data(data, output_dir, _filename, data_format='csv'):
+    """Add the rows of a DataFrame to the end of a file written by `write_data` and return the path written to."""
+    filename = data_path(output_dir, _filename, data_format)
+
+    if data_format == 'parquet':
+        existing = pandas.read_parquet(filename, engine='pyarrow')
+        columns = existing.columns.tolist()
+    else:
+        columns = pandas.read_csv(filename, nrows=0).columns.tolist()
+
+    if columns != data.columns.tolist():
+        raise ValueError("Can't add rows with columns {} to {}, which has columns {}".format(
+            data.columns.tolist(), filename, columns
+        ))
+
+    if data_format == 'parquet':
+        # Give the new rows the types the existing ones were read back with, so the columns can be combined
+        data = _columnar_compatible(data).astype(existing.dtypes.to_dict(), errors='ignore')
+        _columnar_compatible(pandas.concat([existing, data])).to_parquet(filename, engine='pyarrow')
+    else:
+        data.to_csv(filename, mode='a', header=False, index=False, encoding='utf-8')
+
+    return filename
+
+
+def read_data(output_dir, _filename, data_format='csv'):
+    """Read a DataFrame written by `write_data`, falling back to a CSV if there's no file in `data_format`."""
+    filename = data_path(output_dir, _filename, data_format)
+
+    if data_format == 'parquet' and os.path.exists(filename):
+        return pandas.read_parquet(filename, engine='pyarrow').reset_index(drop=True)
+
+    return pandas.read_csv(csv_path(output_dir, _filename))
+
+
+def read_column(output_dir, _filename, column):
+    """Read one column of a CSV written by `write_data`, as the text it was written as."""
+    return pandas.read_csv(csv_path(output_dir, _filename), usecols=[column], dtype=str, keep_default_na=False)[column]
+
+
+def _columnar_compatible(data):
+    """Return `data` with object columns holding values of one type, as columnar formats require.
+
+    Missing values from the API are '', so columns of e.g. ids are a mix of ints and strings. Those blanks are
+    written as nulls. Columns still holding mixed types are written as strings.
+    """
+    data = data.reset_index(drop=True)
+
+    for column in data.columns[data.dtypes == object]:
+        if _value_types(data[column]) <= {str}:
+            continue
+
+        data[column] = data[column].mask(data[column] == '')
+        if len(_value_types(data[column])) > 1:
+            data[column] = data[column].where(data[column].isnull(), data[column].astype(str))
+
+    return data
+
+
+def _value_types(series):
+    return set(map(type, series.dropna()))
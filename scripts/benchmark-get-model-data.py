@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""Benchmark get-model-data against generated data
+
+Run the get-model-data configs against a stand-in API client serving generated users, services, briefs,
+brief responses and direct award projects, and report the time each config takes, the peak memory it
+allocates and the time each step takes across all configs. No API is needed, so this can be run anywhere to
+compare changes to the pipeline.
+
+Memory is measured with `tracemalloc`, which slows the pipeline down; use `--no-memory` for accurate timings.
+
+With `--trawl`, only the rows per second that ModelTrawler picks out each config's keys at is measured, for models
+fetched straight from the API, with the generated data held in memory beforehand so only the trawl is timed.
+
+If called without a model name the script will run all defined models, or `briefs` and `dos_services` with `--trawl`.
+
+Usage:
+    scripts/benchmark-get-model-data.py [options] [<model>...]
+
+Options:
+    -h --help       Show this screen.
+    --scale=<rows>  Number of brief responses to generate, with the other models in proportion [default: 10000]
+    --seed=<seed>  Seed for the generated data [default: 1]
+    --output-dir=<output_dir>  Directory to write csv files to [default: benchmark-data]
+    --format=<format>  Format to also save models that other models are built from in: csv or parquet [default: csv]
+    --report=<file>  Also write the results to this file as JSON
+    --no-memory  Don't measure memory
+    --trawl  Only measure the rows per second ModelTrawler gets each model's keys at
+    --repeat=<times>  Number of times to trawl each model with `--trawl`, reporting the fastest [default: 5]
+"""
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from functools import partial
+sys.path.insert(0, '.')
+
+from docopt import docopt
+
+from dmscripts.get_model_data import CONFIGS, process_config
+from dmscripts.helpers.logging_helpers import logging, configure_logger
+from dmscripts.models.fakeapi import FakeDataAPIClient
+from dmscripts.models.modeltrawler import ModelTrawler
+from dmscripts.models.planner import plan_config
+from dmscripts.models.registry import FrameRegistry
+from dmscripts.models.scheduler import dependency_graph, run_configs
+from dmscripts.models.sharedfetch import SharedFetches
+from dmscripts.models.stepreport import StepReport
+
+
+def measure(process_config, results, trace_memory, config):
+    if trace_memory:
+        # Restart tracing so the peak is the most allocated while processing this config
+        tracemalloc.stop()
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    process_config(config)
+    result = {'name': config['name'], 'seconds': round(time.perf_counter() - start, 3)}
+
+    if trace_memory:
+        result['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+
+    results.append(result)
+
+
+class GeneratedModelsClient(object):
+    """Serves a list of already generated models from `find_<model>_iter`, so generating them isn't timed."""
+
+    def __init__(self, models):
+        self.models = models
+
+    def __getattr__(self, name):
+        return lambda **kwargs: iter(self.models)
+
+
+def trawl_rates(client, configs, repeat):
+    """Return the rows per second ModelTrawler gets each config's keys at, the fastest of `repeat` trawls."""
+    results = []
+    for config in configs:
+        models = list(getattr(client, 'find_{}_iter'.format(config['base_model']))(**config['get_data_kwargs']))
+        trawler = ModelTrawler(config['base_model'], GeneratedModelsClient(models))
+
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            trawler.get_data(keys=config['keys'])
+            seconds.append(time.perf_counter() - start)
+
+        results.append({
+            'name': config['name'], 'rows': len(models), 'seconds': round(min(seconds), 4),
+            'rows_per_second': round(len(models) / min(seconds)),
+        })
+
+    return results
+
+
+def trawl(arguments, client):
+    models = set(arguments['<model>'] or ('briefs', 'dos_services'))
+    configs = [config for config in CONFIGS if config['name'] in models]
+    if any('base_model' not in config for config in configs):
+        sys.exit("--trawl only measures models fetched from the API")
+
+    results = trawl_rates(client, configs, int(arguments['--repeat']))
+    for result in results:
+        print('{name:<50} {rows:>10} rows {rows_per_second:>10} rows/s'.format(**result))
+
+    if arguments['--report']:
+        with open(arguments['--report'], 'w') as f:
+            json.dump({
+                'scale': int(arguments['--scale']), 'seed': int(arguments['--seed']), 'trawls': results
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    OUTPUT_DIR = arguments['--output-dir']
+    MODELS = arguments['<model>']
+    trace_memory = not arguments['--no-memory']
+
+    logger = configure_logger({'dmapiclient': logging.WARNING})
+
+    client = FakeDataAPIClient(scale=int(arguments['--scale']), seed=int(arguments['--seed']))
+    if arguments['--trawl']:
+        trawl(arguments, client)
+        sys.exit()
+
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    MODELS = set(MODELS if MODELS else [config['name'] for config in CONFIGS])
+    configs = [plan_config(config) for config in CONFIGS if config['name'] in MODELS]
+
+    results = []
+    steps = StepReport()
+
+    start = time.perf_counter()
+    run_configs(
+        configs,
+        partial(
+            measure,
+            partial(
+                process_config,
+                client=client, output_dir=OUTPUT_DIR, logger=logger,
+                registry=FrameRegistry(keep=set().union(*dependency_graph(configs).values())),
+                data_format=arguments['--format'], fetches=SharedFetches(configs), report=steps,
+            ),
+            results,
+            trace_memory,
+        )
+    )
+
+    report = {
+        'scale': int(arguments['--scale']),
+        'seed': int(arguments['--seed']),
+        'seconds': round(time.perf_counter() - start, 3),
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10, 1),
+        'configs': results,
+        'steps': steps.steps,
+    }
+
+    for result in results:
+        print('{name:<50} {seconds:>10.3f}s {memory}'.format(
+            memory='{:>10.1f}MB'.format(result['peak_memory_mb']) if trace_memory else '', **result
+        ))
+    print()
+    for step, seconds in steps.totals():
+        print('{:<50} {:>10.3f}s'.format(step, seconds))
+    print('{:<50} {:>10.3f}s (max RSS {}MB)'.format('total', report['seconds'], report['max_rss_mb']))
+
+    if arguments['--report']:
+        with open(arguments['--report'], 'w') as f:
+            json.dump(report, f, indent=2)
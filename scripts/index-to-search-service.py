@@ -17,6 +17,28 @@ Options:
                                                   .json suffix) as would be found by the search-api in its
                                                   digitalmarketplace-search-api/mappings directory.
     --serial                                      Do not run in parallel (useful for debugging)
+    --workers=<workers>                           Number of threads sending items to the search API, or the most
+                                                  with --min-workers [default: 10]
+    --min-workers=<workers>                       Adjust the number of items sent at once between this and
+                                                  --workers, backing off when the search API is slow or failing
+    --max-latency=<seconds>                       Seconds a request can take before --min-workers counts it as
+                                                  slow [default: 1]
+    --queue-size=<items>                          Number of fetched items (or batches) to hold while the workers
+                                                  are busy, before fetching waits [default: 100]
+    --since=<datetime>                            Only index items changed since this time, found from their audit
+                                                  events, e.g. 2018-10-17T09:00:00.000000Z
+    --watermark-file=<file>                       Save the time of each successful run to this file, and only index
+                                                  items changed since the last one if --since isn't given
+    --checkpoint-file=<file>                      Record progress through a full reindex in this file, a page of
+                                                  items at a time, so that it can be resumed if interrupted
+    --resume                                      Carry on from the progress recorded in --checkpoint-file
+    --hash-store=<file>                           Keep a hash of each document sent in this file, and don't send
+                                                  documents again until they change
+    --force                                       Send every document, even if --hash-store has it unchanged
+    --fetch-per-framework                         Fetch each of --frameworks at the same time, rather than in one
+                                                  list, with progress for each
+    --bulk-size=<items>                           Send items to the search API in batches of this many. Fails if
+                                                  the search API client can't send bulk requests [default: 1]
     --api-url=<api-url>                           Override API URL (otherwise automatically populated)
     --api-token=<api_access_token>                Override API token (otherwise automatically populated)
     --search-api-url=<search-api-url>             Override search API URL (otherwise automatically populated)
@@ -30,17 +52,42 @@ Examples:
 --frameworks=digital-outcomes-and-specialists-2 --create-with-mapping=briefs-digital-outcomes-and-specialists-2
 """
 
+import os
 import sys
+from datetime import datetime
 from docopt import docopt
 
 sys.path.insert(0, '.')
 from dmscripts.index_to_search_service import do_index
 from dmscripts.helpers.auth_helpers import get_auth_token
+from dmscripts.models.watermarks import Watermarks
 from dmutils.env_helpers import get_api_endpoint_from_stage
+from dmutils.formats import DATETIME_FORMAT
 
 
 if __name__ == "__main__":
     arguments = docopt(__doc__)
+
+    if arguments['--since']:
+        try:
+            datetime.strptime(arguments['--since'], DATETIME_FORMAT)
+        except ValueError:
+            sys.exit("--since must be a time in the format {}".format(DATETIME_FORMAT))
+
+    if arguments['--resume'] and not arguments['--checkpoint-file']:
+        sys.exit("--resume needs a --checkpoint-file to resume from")
+
+    min_workers = int(arguments['--min-workers']) if arguments['--min-workers'] else None
+    if min_workers is not None:
+        if arguments['--serial']:
+            sys.exit("--min-workers can't be used with --serial")
+        if not 1 <= min_workers <= int(arguments['--workers']):
+            sys.exit("--min-workers must be between 1 and --workers ({})".format(arguments['--workers']))
+
+    watermark_file = arguments['--watermark-file']
+    watermarks = Watermarks(os.path.dirname(watermark_file) or '.', os.path.basename(watermark_file)) \
+        if watermark_file else None
+
     ok = do_index(
         doc_type=arguments['<doc-type>'],
         data_api_url=arguments['--api-url'] or get_api_endpoint_from_stage(arguments['<stage>'], 'api'),
@@ -51,6 +98,18 @@ if __name__ == "__main__":
         serial=arguments['--serial'],
         index=arguments['--index'],
         frameworks=arguments['--frameworks'],
+        bulk_size=int(arguments['--bulk-size']),
+        workers=int(arguments['--workers']),
+        queue_size=int(arguments['--queue-size']),
+        since=arguments['--since'],
+        watermarks=watermarks,
+        checkpoint_file=arguments['--checkpoint-file'],
+        resume=arguments['--resume'],
+        min_workers=min_workers,
+        max_latency=float(arguments['--max-latency']),
+        hash_store=arguments['--hash-store'],
+        force=arguments['--force'],
+        fetch_per_framework=arguments['--fetch-per-framework'],
     )
 
     if not ok:
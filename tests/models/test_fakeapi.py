@@ -0,0 +1,47 @@
+from dmscripts.models.fakeapi import FakeDataAPIClient
+
+
+def test_models_are_generated_in_proportion_to_scale():
+    client = FakeDataAPIClient(scale=200)
+
+    assert len(list(client.find_brief_responses_iter(status='draft,submitted,awarded'))) == 200
+    assert len(list(client.find_users_iter())) == 100
+    assert len(list(client.find_briefs_iter())) == 20
+    assert len(list(client.find_direct_award_projects_iter())) == 2
+
+
+def test_the_same_seed_generates_the_same_models():
+    assert list(FakeDataAPIClient(scale=20).find_briefs_iter()) == list(FakeDataAPIClient(scale=20).find_briefs_iter())
+    assert list(FakeDataAPIClient(scale=20).find_briefs_iter()) != list(
+        FakeDataAPIClient(scale=20, seed=2).find_briefs_iter()
+    )
+
+
+def test_models_refer_to_models_that_exist():
+    client = FakeDataAPIClient(scale=200)
+    brief_ids = set(brief['id'] for brief in client.find_briefs_iter())
+
+    assert set(response['briefId'] for response in client.find_brief_responses_iter()) <= brief_ids
+
+
+def test_filters():
+    client = FakeDataAPIClient(scale=200)
+
+    assert set(user['role'] for user in client.find_users_iter(role='buyer')) == {'buyer'}
+    assert set(
+        service['frameworkSlug'] for service in client.find_services_iter(framework='g-cloud-8, g-cloud-9')
+    ) == {'g-cloud-8', 'g-cloud-9'}
+
+
+def test_draft_brief_responses_are_only_listed_if_asked_for():
+    client = FakeDataAPIClient(scale=200)
+
+    assert 'draft' not in set(response['status'] for response in client.find_brief_responses_iter())
+    assert set(response['status'] for response in client.find_brief_responses_iter(status='draft')) == {'draft'}
+
+
+def test_direct_award_project_searches_are_for_the_project():
+    searches = list(FakeDataAPIClient().find_direct_award_project_searches_iter(project_id=3))
+
+    assert searches
+    assert set(search['projectId'] for search in searches) == {3}
@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 import mock
 from dmscripts.models.modeltrawler import ModelTrawler
@@ -59,6 +61,32 @@ class TestModelTrawlerMethods:
         mt = ModelTrawler('fake_table', FakeClient())
         assert mt._filter_keys(keys)(initial_model_dict) == expected_model_dict
 
+    def test_filter_keys_returns_empty_string_for_missing_values(self):
+        keys = (
+            'id',
+            'title',
+            ('supplier', 'name'),
+            ('users', 0, 'emailAddress')
+        )
+
+        mt = ModelTrawler('fake_table', FakeClient())
+        assert mt._filter_keys(keys)({'id': 1, 'supplier': {}, 'users': []}) == {
+            'id': 1,
+            'title': '',
+            'name': '',
+            'emailAddress': ''
+        }
+
+    def test_filter_keys_can_be_reused_for_many_models(self):
+        keys = ('id', ('users', 0, 'emailAddress'))
+
+        mt = ModelTrawler('fake_table', FakeClient())
+        filter_keys = mt._filter_keys(keys)
+        assert list(map(filter_keys, self.model_data)) == [
+            {'id': 1, 'emailAddress': 'user@gov.uk'},
+            {'id': 2, 'emailAddress': 'user2@gov.uk'},
+        ]
+
     def test_get_data(self):
         keys = (
             'id',
@@ -86,6 +114,22 @@ class TestModelTrawlerMethods:
             mt = ModelTrawler('fake_table', FakeClient())
             assert tuple(mt.get_data(keys, limit=1)) == expected_model_data
 
+    def test_get_data_chunks(self):
+        model_data = [{'id': i} for i in range(5)]
+
+        with mock.patch.object(FakeClient, 'find_fake_table_iter', return_value=iter(model_data)):
+            mt = ModelTrawler('fake_table', FakeClient())
+            assert list(mt.get_data_chunks(('id',), chunk_size=2)) == [
+                [{'id': 0}, {'id': 1}],
+                [{'id': 2}, {'id': 3}],
+                [{'id': 4}],
+            ]
+
+    def test_get_data_chunks_with_limit(self):
+        with mock.patch.object(FakeClient, 'find_fake_table_iter', return_value=iter(self.model_data)):
+            mt = ModelTrawler('fake_table', FakeClient())
+            assert list(mt.get_data_chunks(('id',), chunk_size=5, limit=1)) == [[{'id': 1}]]
+
     def test_get_data_with_kwargs(self):
         _kwargs = {
             'something_true': True,
@@ -99,3 +143,74 @@ class TestModelTrawlerMethods:
             list(mt.get_data(('id',), limit=1, **_kwargs))
             # note that `limit` isn't included as a keyword argument
             mock_method.assert_called_once_with(something_true=True, something_false=False)
+
+
+class FakePagedClient:
+
+    pages = (
+        [{'id': 1}, {'id': 2}],
+        [{'id': 3}, {'id': 4}],
+        [{'id': 5}],
+    )
+
+    def find_fake_table(self, page=None, **kwargs):
+        result = {'fakeTable': list(self.pages[page - 1]), 'links': {}}
+        if page < len(self.pages):
+            result['links']['next'] = 'http://localhost/fake-table?page={}'.format(page + 1)
+            result['links']['last'] = 'http://localhost/fake-table?page={}'.format(len(self.pages))
+        return result
+
+    def find_fake_table_iter(self, **kwargs):
+        for page in self.pages:
+            for model in page:
+                yield model
+
+
+class TestModelTrawlerPrefetch:
+
+    @pytest.mark.parametrize('prefetch', (1, 2, 5))
+    def test_get_data_with_prefetch_returns_models_in_page_order(self, prefetch):
+        mt = ModelTrawler('fake_table', FakePagedClient(), prefetch=prefetch)
+        assert mt.get_data(('id',)) == [{'id': 1}, {'id': 2}, {'id': 3}, {'id': 4}, {'id': 5}]
+
+    def test_get_data_with_prefetch_requests_each_page_once_with_kwargs(self):
+        with mock.patch.object(FakePagedClient, 'find_fake_table', autospec=True,
+                               side_effect=FakePagedClient.find_fake_table) as find_method:
+            mt = ModelTrawler('fake_table', FakePagedClient(), prefetch=5)
+            mt.get_data(('id',), role='buyer')
+
+        assert sorted(call[1]['page'] for call in find_method.call_args_list) == [1, 2, 3]
+        assert all(call[1]['role'] == 'buyer' for call in find_method.call_args_list)
+
+    @pytest.mark.parametrize('prefetch', (1, 2))
+    def test_iter_pages_fetches_the_next_pages_while_a_page_is_processed(self, prefetch):
+        requested = {page: threading.Event() for page in (2, 3)}
+
+        class RecordingClient(FakePagedClient):
+            def find_fake_table(self, page=None, **kwargs):
+                if page in requested:
+                    requested[page].set()
+                return super(RecordingClient, self).find_fake_table(page=page, **kwargs)
+
+        pages = ModelTrawler('fake_table', RecordingClient(), prefetch=prefetch).iter_pages()
+        next(pages)
+
+        # Up to `prefetch` pages are requested while the first is being processed
+        assert requested[2].wait(timeout=1)
+        if prefetch > 1:
+            assert requested[3].wait(timeout=1)
+        else:
+            assert not requested[3].is_set()
+        pages.close()
+
+    def test_get_data_with_prefetch_and_limit(self):
+        mt = ModelTrawler('fake_table', FakePagedClient(), prefetch=2)
+        assert mt.get_data(('id',), limit=3) == [{'id': 1}, {'id': 2}, {'id': 3}]
+
+    def test_get_data_with_prefetch_falls_back_to_iter_method_if_pages_cannot_be_requested(self):
+        with mock.patch.object(
+            FakeClient, 'find_fake_table_iter', return_value=iter(({'id': 1}, {'id': 2}))
+        ) as mock_method:
+            mt = ModelTrawler('fake_table', FakeClient(), prefetch=2)
+            assert mt.get_data(('id',)) == [{'id': 1}, {'id': 2}]
+            mock_method.assert_called_once_with()
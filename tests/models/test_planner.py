@@ -0,0 +1,109 @@
+import pytest
+
+from dmscripts.models.planner import explain, plan_config, query_columns, split_conjuncts
+
+
+def test_split_conjuncts():
+    assert split_conjuncts("role == 'buyer' and createdAt >= '2016-04-25'") == [
+        "role == 'buyer'", "createdAt >= '2016-04-25'"
+    ]
+
+
+@pytest.mark.parametrize('query', (
+    "role == 'buyer' or createdAt >= '2016-04-25'",
+    "(role == 'buyer' and id > 1) or createdAt >= '2016-04-25'",
+    "name == 'band and orchestra'",
+    "status in ['live', 'closed']",
+    "role == @role and id > 1",
+))
+def test_split_conjuncts_returns_queries_that_arent_conjunctions_whole(query):
+    assert split_conjuncts(query) == [query]
+
+
+def test_query_columns():
+    assert query_columns("status in ['live', 'closed'] and id > 1") == {'status', 'id'}
+    assert query_columns("role == @role") is None
+    assert query_columns("status.str.startswith('l')") is None
+
+
+def test_plan_config_moves_api_filters_to_get_data_kwargs():
+    config = {
+        'name': 'buyer_users',
+        'base_model': 'users',
+        'keys': ('id', 'emailAddress', 'createdAt', 'role'),
+        'get_data_kwargs': {},
+        'process_fields': {'createdAt': str},
+        'filter_query': "role == 'buyer' and createdAt >= '2016-04-25'",
+    }
+
+    planned = plan_config(config)
+
+    assert planned['get_data_kwargs'] == {'role': 'buyer'}
+    assert planned['filter_query'] == "createdAt >= '2016-04-25'"
+    assert 'early_filter_query' not in planned
+    # The config itself isn't changed
+    assert config['get_data_kwargs'] == {}
+    assert config['filter_query'] == "role == 'buyer' and createdAt >= '2016-04-25'"
+
+
+def test_plan_config_moves_filters_on_unchanged_columns_early():
+    planned = plan_config({
+        'name': 'brief_responses_summary',
+        'model': 'briefs',
+        'add_counts': {'model_name': 'brief_responses', 'join': ('id', 'briefId'), 'group_by': 'status'},
+        'process_fields': {'title': str},
+        'filter_query': "status in ['live', 'closed'] and title != ''",
+        'keys': ('id', 'title', 'status', 'status-live'),
+    })
+
+    assert planned['early_filter_query'] == "status in ['live', 'closed']"
+    assert planned['filter_query'] == "title != ''"
+    assert planned['load_columns'] == ['id', 'status', 'status-live', 'title']
+
+
+@pytest.mark.parametrize('step', (
+    {'joins': [{'model_name': 'briefs', 'left_on': 'briefId', 'right_on': 'id'}]},
+    {'aggregation_counts': [{'group_by': 'id', 'join': ('id', 'id'), 'count_name': 'total'}]},
+    {'get_by_model_fk': {'model_to_get': 'other', 'fk_column_name': 'fk', 'get_data_kwargs': {}}},
+))
+def test_plan_config_doesnt_move_filters_past_steps_that_change_rows(step):
+    config = dict({
+        'name': 'example',
+        'model': 'brief_responses',
+        'filter_query': "status == 'awarded'",
+        'keys': ('id', 'status'),
+    }, **step)
+
+    assert plan_config(config)['filter_query'] == "status == 'awarded'"
+    assert 'early_filter_query' not in plan_config(config)
+
+
+def test_plan_config_doesnt_project_configs_with_joins_or_unknown_columns():
+    config = {
+        'name': 'example',
+        'model': 'brief_responses',
+        'joins': [{'model_name': 'briefs', 'left_on': 'briefId', 'right_on': 'id'}],
+        'keys': ('id', 'status'),
+    }
+    assert 'load_columns' not in plan_config(config)
+
+    config = {'name': 'example', 'model': 'brief_responses', 'filter_query': 'status == @status', 'keys': ('id',)}
+    assert 'load_columns' not in plan_config(config)
+
+
+def test_explain():
+    config = plan_config({
+        'name': 'buyer_users',
+        'base_model': 'users',
+        'keys': ('id', ('supplier', 'supplierId'), 'role'),
+        'get_data_kwargs': {},
+        'filter_query': "role == 'buyer'",
+        'sort_by': 'id',
+    })
+
+    assert explain(config) == [
+        "buyer_users:",
+        "  1. Fetch users ['id', 'supplierId', 'role'] with {'role': 'buyer'}",
+        "  2. Keep columns ['id', 'supplierId', 'role']",
+        "  3. Sort by id",
+    ]
@@ -1,6 +1,9 @@
 import pytest
+from pandas import Series
+
 from dmscripts.models.process_rules import (
     format_datetime_string_as_date,
+    format_datetime_strings_as_dates,
     remove_username_from_email_address,
     extract_id_from_user_info
 )
@@ -25,6 +28,27 @@ def test_format_datetime_string_as_date_raises_error_if_initial_date_format_inco
         assert "time data '{}' does not match format".format(date) in str(excinfo.value)
 
 
+def test_format_datetime_strings_as_dates_matches_format_datetime_string_as_date():
+    values = Series(["2016-10-08T12:00:00.00000Z", "", None, "2017-01-31T23:59:59.123456Z"], index=[3, 2, 1, 0])
+
+    dates = format_datetime_strings_as_dates(values)
+
+    assert dates.to_dict() == values.apply(format_datetime_string_as_date).to_dict()
+    assert dates.to_dict() == {3: "2016-10-08", 2: None, 1: None, 0: "2017-01-31"}
+
+
+@pytest.mark.parametrize('value', (
+    "2016-10-08T12:00:00.00000",
+    "2016-10-08",
+    "2016-1-08T12:00:00.00000Z",
+    "2016-02-30T12:00:00.00000Z",
+    "2016-10-08T24:00:00.00000Z",
+))
+def test_format_datetime_strings_as_dates_raises_value_error_for_values_it_cant_format(value):
+    with pytest.raises(ValueError):
+        format_datetime_strings_as_dates(Series(["2016-10-08T12:00:00.00000Z", value]))
+
+
 def test_remove_username_from_email_address():
     initial_email_address = "user.name@domain.com"
     formatted_email_address = "domain.com"
@@ -1,9 +1,11 @@
+import time
 import mock
 import pytest
 from collections import OrderedDict
 
 from pandas import DataFrame
 from dmscripts.models import queries
+from dmscripts.models.registry import FrameRegistry
 
 
 @pytest.fixture
@@ -15,12 +17,68 @@ def csv_reader(request):
     return read_csv_mock
 
 
+@pytest.mark.parametrize('chunk_size', (None, 2))
+@mock.patch('dmscripts.models.queries.ModelTrawler')
+def test_base_model(model_trawler, chunk_size):
+    rows = [{'id': 1, 'val': 'one'}, {'id': 2, 'val': 'two'}, {'id': 3, 'val': 'three'}]
+    model_trawler.return_value.get_data.return_value = rows
+    model_trawler.return_value.get_data_chunks.return_value = iter([rows[:2], rows[2:]])
+
+    data = queries.base_model('example', ('id', 'val'), {'a': 'b'}, 'fake_client', chunk_size=chunk_size)
+
+    assert data.values.tolist() == [[1, 'one'], [2, 'two'], [3, 'three']]
+    assert data.index.tolist() == [0, 1, 2]
+
+
+@pytest.mark.parametrize('chunk_size', (None, 2))
+@mock.patch('dmscripts.models.queries.ModelTrawler')
+def test_base_model_returns_empty_dataframe_with_column_headings_if_no_data(model_trawler, chunk_size):
+    model_trawler.return_value.get_data.return_value = []
+    model_trawler.return_value.get_data_chunks.return_value = iter([])
+
+    data = queries.base_model('example', ('id', 'val'), {}, 'fake_client', chunk_size=chunk_size)
+
+    assert data.equals(DataFrame(columns=('id', 'val')))
+
+
+@pytest.mark.parametrize('chunk_size', (None, 2))
+@mock.patch('dmscripts.models.queries.ModelTrawler')
+def test_base_model_sets_dtypes(model_trawler, chunk_size):
+    rows = [{'id': 1, 'status': 'live'}, {'id': 2, 'status': 'closed'}, {'id': 3, 'status': 'live'}]
+    model_trawler.return_value.get_data.return_value = rows
+    model_trawler.return_value.get_data_chunks.return_value = iter([rows[:2], rows[2:]])
+
+    data = queries.base_model(
+        'example', ('id', 'status'), {}, 'fake_client', chunk_size=chunk_size,
+        dtypes={'status': 'category', 'missing': 'category'}
+    )
+
+    assert data['status'].dtype == 'category'
+    assert data['status'].cat.categories.tolist() == ['closed', 'live']
+    assert data.values.tolist() == [[1, 'live'], [2, 'closed'], [3, 'live']]
+
+
 def test_model(csv_reader):
     csv_reader.return_value = DataFrame([1, 2])
 
     assert queries.model('example', 'data').values.tolist() == [[1], [2]]
 
 
+def test_model_is_taken_from_registry_if_held(csv_reader):
+    registry = FrameRegistry()
+    registry.add('example', DataFrame([3, 4]))
+
+    assert queries.model('example', 'data', registry=registry).values.tolist() == [[3], [4]]
+    assert not csv_reader.called
+
+
+def test_model_is_read_from_csv_if_not_in_registry(csv_reader):
+    csv_reader.return_value = DataFrame([1, 2])
+
+    assert queries.model('example', 'data', registry=FrameRegistry()).values.tolist() == [[1], [2]]
+    csv_reader.assert_called_once_with('data/example.csv')
+
+
 def test_join(csv_reader):
     left_data = DataFrame([
         {'fk': 1, 'col': 100},
@@ -44,6 +102,34 @@ def test_join(csv_reader):
     assert queries.join(left_data, directory='data', **config_value).values.tolist() == expected_result
 
 
+def test_join_fills_blanks_in_categorical_columns(csv_reader):
+    left_data = DataFrame([
+        {'fk': 1, 'status': 'live'},
+        {'fk': 2, 'status': 'closed'},
+    ]).astype({'status': 'category'})
+    csv_reader.return_value = DataFrame([
+        {'id': 1, 'lot': 'digital-outcomes'},
+        {'id': 1, 'lot': 'digital-specialists'},
+    ]).astype({'lot': 'category'})
+
+    data = queries.join(left_data, 'n', 'fk', 'id', 'data')
+
+    assert data.values.tolist() == [
+        [1, 'live', 1, 'digital-outcomes'],
+        [1, 'live', 1, 'digital-specialists'],
+        [2, 'closed', '', ''],
+    ]
+    assert data['status'].cat.categories.tolist() == ['closed', 'live']
+    assert data['lot'].cat.categories.tolist() == ['', 'digital-outcomes', 'digital-specialists']
+
+
+def test_group_by_only_counts_categories_in_the_data():
+    data = DataFrame([{'status': 'live'}]).astype({'status': 'category'})
+    data['status'] = data['status'].cat.add_categories(['closed'])
+
+    assert queries.group_by('status', data).values.tolist() == [['live', 1]]
+
+
 def test_filter_rows():
     assert queries.filter_rows('val > 5 and val < 10', DataFrame([
         {'id': 1, 'val': 7},
@@ -68,6 +154,27 @@ def test_process_fields():
     ]
 
 
+@mock.patch.dict('dmscripts.models.queries.VECTORISED_RULES')
+def test_process_fields_uses_vectorised_rules():
+    def rule(value):
+        return value * 2
+    queries.VECTORISED_RULES[rule] = lambda values: values * 3
+
+    assert queries.process_fields({'val': rule}, DataFrame([{'val': 1}])).values.tolist() == [[3]]
+
+
+@mock.patch.dict('dmscripts.models.queries.VECTORISED_RULES')
+def test_process_fields_applies_rules_to_each_value_if_vectorised_rule_fails():
+    def rule(value):
+        return value * 2
+
+    def vectorised_rule(values):
+        raise TypeError()
+    queries.VECTORISED_RULES[rule] = vectorised_rule
+
+    assert queries.process_fields({'val': rule}, DataFrame([{'val': 1}])).values.tolist() == [[2]]
+
+
 def test_sort_by():
     assert queries.sort_by('val', DataFrame([
         {'id': 1, 'val': 7},
@@ -144,6 +251,36 @@ def test_add_counts(csv_reader):
     ]
 
 
+def test_add_counts_keeps_integer_counts_if_every_row_has_counts(csv_reader):
+    csv_reader.return_value = DataFrame([
+        {'fk': 2, 'status': True},
+        {'fk': 1, 'status': 'other'},
+        {'fk': 1, 'status': True},
+        {'fk': 2, 'status': True},
+    ])
+
+    data = queries.add_counts(('id', 'fk'), 'status', 'example', DataFrame([
+        {'id': 2, 'val': 'two'},
+        {'id': 1, 'val': 'one'},
+    ]), 'data')
+
+    # Columns are in the order groups first appear when counts are sorted by the join column
+    assert data.axes[1].tolist() == [u'id', u'val', u'status-True', u'status-other']
+    assert data['status-True'].dtype == 'int64'
+    assert data.values.tolist() == [
+        [2, 'two', 2, 0.0],
+        [1, 'one', 1, 1.0],
+    ]
+
+
+def test_add_counts_with_no_rows_to_count(csv_reader):
+    csv_reader.return_value = DataFrame(columns=['fk', 'status'])
+
+    data = queries.add_counts(('id', 'fk'), 'status', 'example', DataFrame([{'id': 1, 'val': 'one'}]), 'data')
+
+    assert data.axes[1].tolist() == [u'id', u'val']
+
+
 def test_assign_json_subfields():
     """Test fields are attributed at data level by assign_json_subfields"""
     od1 = OrderedDict([('field1', '111'), ('field2', '222'), ('field3', '333')])
@@ -169,6 +306,21 @@ def test_assign_json_subfields():
     assert data.values.tolist()[4] == [5, {}, '', '']
 
 
+def test_assign_json_subfields_of_empty_data():
+    data = queries.assign_json_subfields('json_field', ['field1', 'field3'], DataFrame(columns=['id', 'json_field']))
+
+    assert list(data.columns) == ['id', 'json_field', 'field1', 'field3']
+    assert data.empty
+
+
+def test_assign_json_subfields_keeps_the_index_of_data():
+    data = DataFrame([{'json_field': {'field1': 'a'}}, {'json_field': None}], index=[7, 3])
+
+    data = queries.assign_json_subfields('json_field', ('field1',), data)
+
+    assert data['field1'].to_dict() == {7: 'a', 3: ''}
+
+
 def test_add_aggregation_counts():
     data = DataFrame([
         {'id': 1, 'fk': 1},
@@ -237,6 +389,64 @@ def test_add_aggregation_counts_filter():
     assert data.values.tolist() == expected_result
 
 
+@pytest.fixture
+def aggregation_data():
+    return DataFrame([
+        {'id': 1, 'fk': 1, 'some_field': 'good'},
+        {'id': 2, 'fk': 1, 'some_field': 'bad'},
+        {'id': 3, 'fk': 2, 'some_field': 'bad'},
+        {'id': 4, 'fk': None, 'some_field': 'good'},
+        {'id': 5, 'fk': 3, 'some_field': 'good'},
+    ], index=[4, 3, 2, 1, 0])
+
+
+@pytest.mark.parametrize('counts', (
+    [
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'good', 'query': 'some_field == "good"'},
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'total'},
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'not_bad', 'query': 'some_field != "bad"'},
+    ],
+    # Counts that can't be computed together
+    [
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'total'},
+        {'group_by': 'fk', 'join': ('id', 'fk'), 'count_name': 'other_join'},
+    ],
+    [
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'good', 'query': 'some_field == "good"'},
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'more_good', 'query': 'good > 1'},
+    ],
+    [
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'some_field'},
+    ],
+))
+def test_add_all_aggregation_counts_matches_adding_each_count(aggregation_data, counts):
+    expected = aggregation_data.copy()
+    for count in counts:
+        expected = queries.add_aggregation_counts(expected, **count)
+
+    data = queries.add_all_aggregation_counts(aggregation_data, counts)
+
+    assert data.equals(expected)
+    assert data.dtypes.tolist() == expected.dtypes.tolist()
+
+
+def test_add_all_aggregation_counts_in_one_pass(aggregation_data):
+    data = queries.add_all_aggregation_counts(aggregation_data, [
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'good', 'query': 'some_field == "good"'},
+        {'group_by': 'fk', 'join': ('fk', 'fk'), 'count_name': 'total'},
+    ])
+
+    assert data.columns.tolist() == ['fk', 'id', 'some_field', 'good', 'total']
+    assert data['total'].dtype == 'float64'
+    assert data.fillna('-').values.tolist() == [
+        [1.0, 1, 'good', 1.0, 2.0],
+        [1.0, 2, 'bad', 1.0, 2.0],
+        [2.0, 3, 'bad', '-', 1.0],
+        ['-', 4, 'good', '-', '-'],
+        [3.0, 5, 'good', 1.0, 1.0],
+    ]
+
+
 def test_drop_duplicates():
     data = DataFrame([
         OrderedDict([('id', 1), ('fk', 1)]),
@@ -329,6 +539,30 @@ def test_get_model_by_fk(base_model):
     ])
 
 
+@mock.patch('dmscripts.models.queries.base_model')
+def test_get_model_by_fk_with_workers_keeps_the_order_of_the_ids(base_model):
+    def fake_base_model(model, keys, get_data_kwargs, client):
+        fk = get_data_kwargs['other_model_fk']
+        # Make earlier ids take longer, so their requests finish last
+        time.sleep(0.01 * (5 - fk))
+        return DataFrame([{'key_1': fk, 'key_2': 'item'}] * (fk % 3))
+
+    base_model.side_effect = fake_base_model
+
+    data = DataFrame([{'id': fk} for fk in range(1, 6)])
+    config_entry = {
+        'model_to_get': 'other_model',
+        'fk_column_name': 'other_model_fk',
+        'get_data_kwargs': {},
+    }
+
+    data = queries.get_by_model_fk(config_entry, ('key_1', 'key_2'), data, 'fake_client', workers=3)
+
+    assert data['key_1'].tolist() == [1, 2, 2, 4, 5, 5]
+    assert data.index.tolist() == list(range(6))
+    assert base_model.call_count == 5
+
+
 @mock.patch('dmscripts.models.queries.base_model')
 def test_get_model_by_fk_and_filter_before_request(base_model):
     base_model.return_value = DataFrame()
@@ -0,0 +1,164 @@
+import json
+
+import mock
+
+from dmapiclient import HTTPError
+from dmscripts.models.modeltrawler import ModelTrawler
+from dmscripts.models.rawcache import RawModelCache
+
+
+class FakePagedClient:
+
+    def __init__(self, models, page_size=2):
+        self.models = models
+        self.page_size = page_size
+        self.requested_pages = []
+
+    def find_fake_table(self, page=None, **kwargs):
+        self.requested_pages.append(page)
+        last_page = max((len(self.models) - 1) // self.page_size + 1, 1)
+        result = {
+            'fakeTable': self.models[(page - 1) * self.page_size:page * self.page_size],
+            'links': {},
+            'meta': {'total': len(self.models)},
+        }
+        if page < last_page:
+            result['links']['next'] = 'http://localhost/fake-table?page={}'.format(page + 1)
+            result['links']['last'] = 'http://localhost/fake-table?page={}'.format(last_page)
+        return result
+
+    def find_fake_table_iter(self, **kwargs):
+        return iter(self.models)
+
+
+class FakeNotFoundPagedClient(FakePagedClient):
+
+    def find_fake_table(self, page=None, **kwargs):
+        result = super(FakeNotFoundPagedClient, self).find_fake_table(page=page, **kwargs)
+        if page > 1 and not result['fakeTable']:
+            raise HTTPError(mock.Mock(status_code=404))
+        return result
+
+
+def get_models(cache, client, keys=None, **kwargs):
+    return list(cache.get_models(ModelTrawler('fake_table', client), keys, **kwargs))
+
+
+def read_store(cache, kwargs=None, keys=None):
+    with open(cache.path('fake_table', kwargs or {}, keys) + '.jsonl') as f:
+        return [json.loads(line) for line in f]
+
+
+class TestRawModelCache:
+
+    def test_first_fetch_gets_all_models_and_stores_them(self, tmpdir):
+        client = FakePagedClient([{'id': i} for i in range(5)])
+        cache = RawModelCache(str(tmpdir))
+
+        assert get_models(cache, client, framework='g-cloud-9') == [{'id': i} for i in range(5)]
+        assert client.requested_pages == [1, 2, 3]
+
+        assert read_store(cache, {'framework': 'g-cloud-9'}) == [[i, {'id': i}] for i in range(5)]
+        with open(cache.path('fake_table', {'framework': 'g-cloud-9'}) + '.json') as f:
+            details = json.load(f)
+        assert details['page_size'] == 2
+        assert details['count'] == 5
+
+    def test_only_the_keyed_fields_are_stored(self, tmpdir):
+        client = FakePagedClient([{'id': i, 'name': 'Model', 'user': {'email': 'a@b'}} for i in range(3)])
+        cache = RawModelCache(str(tmpdir))
+        keys = ('name', ('user', 'email'))
+
+        assert get_models(cache, client, keys) == [{'name': 'Model', 'email': 'a@b'}] * 3
+        assert read_store(cache, keys=keys) == [[i, {'name': 'Model', 'email': 'a@b'}] for i in range(3)]
+
+        client.requested_pages = []
+        assert get_models(cache, client, keys) == [{'name': 'Model', 'email': 'a@b'}] * 3
+        assert client.requested_pages == [2]
+
+    def test_later_fetches_only_request_pages_from_the_last_cached_page(self, tmpdir):
+        client = FakePagedClient([{'id': i} for i in range(5)])
+        cache = RawModelCache(str(tmpdir))
+        get_models(cache, client)
+
+        client.models = client.models + [{'id': 5}, {'id': 6}, {'id': 7}]
+        client.requested_pages = []
+
+        assert get_models(cache, client) == [{'id': i} for i in range(8)]
+        assert client.requested_pages == [3, 4]
+        assert read_store(cache) == [[i, {'id': i}] for i in range(8)]
+
+    def test_updated_models_on_fetched_pages_replace_cached_models(self, tmpdir):
+        client = FakePagedClient([{'id': 0, 'v': 'a'}, {'id': 1, 'v': 'a'}, {'id': 2, 'v': 'a'}])
+        cache = RawModelCache(str(tmpdir))
+        get_models(cache, client)
+
+        client.models = [{'id': 0, 'v': 'a'}, {'id': 1, 'v': 'a'}, {'id': 2, 'v': 'b'}]
+
+        assert get_models(cache, client) == [{'id': 0, 'v': 'a'}, {'id': 1, 'v': 'a'}, {'id': 2, 'v': 'b'}]
+
+    def test_a_refreshing_cache_fetches_everything_and_updates_the_store(self, tmpdir):
+        client = FakePagedClient([{'id': 0, 'v': 'a'}, {'id': 1, 'v': 'a'}, {'id': 2, 'v': 'a'}])
+        cache = RawModelCache(str(tmpdir))
+        get_models(cache, client)
+
+        client.models = [{'id': 0, 'v': 'b'}, {'id': 1, 'v': 'a'}, {'id': 2, 'v': 'a'}]
+        client.requested_pages = []
+
+        assert get_models(cache.refreshing(), client) == client.models
+        assert client.requested_pages == [1, 2]
+        assert read_store(cache) == [[model['id'], model] for model in client.models]
+
+    def test_the_store_is_only_updated_once_every_model_is_fetched(self, tmpdir):
+        client = FakePagedClient([{'id': i} for i in range(5)])
+        cache = RawModelCache(str(tmpdir))
+        get_models(cache, client)
+
+        client.models = [{'id': i, 'v': 'b'} for i in range(5)]
+        models = cache.get_models(ModelTrawler('fake_table', client), None)
+        next(models)
+        models.close()
+
+        assert read_store(cache) == [[i, {'id': i}] for i in range(5)]
+
+    def test_fetches_everything_again_if_merged_models_do_not_match_api_total(self, tmpdir):
+        client = FakePagedClient([{'id': i} for i in range(5)])
+        cache = RawModelCache(str(tmpdir))
+        get_models(cache, client)
+
+        client.models = [{'id': i} for i in range(1, 5)]
+        client.requested_pages = []
+
+        assert get_models(cache, client) == [{'id': i} for i in range(1, 5)]
+        assert client.requested_pages == [3, 1, 2]
+
+    def test_fetches_everything_again_if_last_cached_page_is_not_found(self, tmpdir):
+        client = FakeNotFoundPagedClient([{'id': i} for i in range(5)])
+        cache = RawModelCache(str(tmpdir))
+        get_models(cache, client)
+
+        client.models = [{'id': i} for i in range(1, 5)]
+        client.requested_pages = []
+
+        assert get_models(cache, client) == [{'id': i} for i in range(1, 5)]
+        assert client.requested_pages == [3, 1, 2]
+
+    def test_fetches_everything_again_if_cache_is_too_old(self, tmpdir):
+        client = FakePagedClient([{'id': i} for i in range(5)])
+        cache = RawModelCache(str(tmpdir), max_age=60)
+
+        with mock.patch('dmscripts.models.rawcache.time.time', return_value=1000):
+            get_models(cache, client)
+        client.requested_pages = []
+        with mock.patch('dmscripts.models.rawcache.time.time', return_value=1061):
+            get_models(cache, client)
+
+        assert client.requested_pages == [1, 2, 3]
+
+    def test_stores_are_keyed_by_request_kwargs_and_keys(self, tmpdir):
+        cache = RawModelCache(str(tmpdir))
+
+        assert cache.path('fake_table', {'a': 1, 'b': 2}) == cache.path('fake_table', {'b': 2, 'a': 1})
+        assert cache.path('fake_table', {'a': 1}) != cache.path('fake_table', {'a': 2})
+        assert cache.path('fake_table', {'a': 1}) != cache.path('other_table', {'a': 1})
+        assert cache.path('fake_table', {'a': 1}, ('id',)) != cache.path('fake_table', {'a': 1}, ('id', 'name'))
@@ -0,0 +1,41 @@
+from pandas import DataFrame
+
+from dmscripts.models.registry import FrameRegistry
+
+
+def test_get_returns_none_for_frames_not_held():
+    assert FrameRegistry().get('example') is None
+
+
+def test_get_returns_a_copy_of_the_frame_with_a_fresh_index():
+    registry = FrameRegistry()
+    data = DataFrame([{'id': 2, 'val': 'two'}, {'id': 1, 'val': 'one'}], index=[5, 3])
+    registry.add('example', data)
+
+    held = registry.get('example')
+    held['val'] = 'changed'
+
+    assert held.index.tolist() == [0, 1]
+    assert registry.get('example').values.tolist() == [[2, 'two'], [1, 'one']]
+
+
+def test_frames_keep_their_dtypes():
+    registry = FrameRegistry()
+    registry.add('example', DataFrame([{'id': 1, 'value': '1000', 'flag': True}]))
+
+    assert registry.get('example').to_dict('records') == [{'id': 1, 'value': '1000', 'flag': True}]
+
+
+def test_only_frames_to_keep_are_held():
+    registry = FrameRegistry(keep={'briefs'})
+    registry.add('briefs', DataFrame([{'id': 1}]))
+    registry.add('buyer_users', DataFrame([{'id': 1}]))
+
+    assert 'briefs' in registry
+    assert 'buyer_users' not in registry
+
+
+def test_keeps_only_the_frames_to_keep():
+    assert FrameRegistry().keeps('briefs')
+    assert FrameRegistry(keep={'briefs'}).keeps('briefs')
+    assert not FrameRegistry(keep={'briefs'}).keeps('buyer_users')
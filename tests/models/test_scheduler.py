@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from dmscripts.models.scheduler import config_dependencies, dependency_graph, run_configs
+
+
+CONFIGS = [
+    {'name': 'users', 'base_model': 'users'},
+    {'name': 'briefs', 'base_model': 'briefs'},
+    {'name': 'brief_responses', 'base_model': 'brief_responses'},
+    {
+        'name': 'brief_responses_summary',
+        'model': 'briefs',
+        'add_counts': {'model_name': 'brief_responses', 'join': ('id', 'briefId'), 'group_by': 'status'},
+    },
+    {
+        'name': 'opportunity_data',
+        'model': 'briefs',
+        'joins': [{'model_name': 'brief_responses_summary', 'left_on': 'id', 'right_on': 'id'}],
+    },
+]
+
+
+def test_config_dependencies():
+    assert config_dependencies(CONFIGS[0]) == set()
+    assert config_dependencies(CONFIGS[3]) == {'briefs', 'brief_responses'}
+    assert config_dependencies(CONFIGS[4]) == {'briefs', 'brief_responses_summary'}
+
+
+def test_dependency_graph_ignores_models_not_being_processed():
+    assert dependency_graph(CONFIGS[3:]) == {
+        'brief_responses_summary': set(),
+        'opportunity_data': {'brief_responses_summary'},
+    }
+
+
+@pytest.mark.parametrize('workers', (1, 2, 5))
+def test_run_configs_runs_configs_after_their_dependencies(workers):
+    finished = []
+    lock = threading.Lock()
+
+    def process_config(config):
+        with lock:
+            assert config_dependencies(config) <= set(finished)
+            finished.append(config['name'])
+
+    run_configs(CONFIGS, process_config, workers=workers)
+
+    assert sorted(finished) == sorted(config['name'] for config in CONFIGS)
+
+
+def test_run_configs_with_one_worker_keeps_config_order():
+    finished = []
+    run_configs(CONFIGS, lambda config: finished.append(config['name']), workers=1)
+
+    assert finished == [config['name'] for config in CONFIGS]
+
+
+def test_run_configs_runs_independent_configs_at_the_same_time():
+    # Each base model waits for the others to start, so this only finishes if they run concurrently
+    barrier = threading.Barrier(3, timeout=5)
+
+    def process_config(config):
+        if 'base_model' in config:
+            barrier.wait()
+
+    run_configs(CONFIGS, process_config, workers=3)
+
+
+def test_run_configs_stops_starting_configs_after_a_failure():
+    finished = []
+
+    def process_config(config):
+        if config['name'] == 'briefs':
+            raise ValueError('disaster')
+        finished.append(config['name'])
+
+    with pytest.raises(ValueError) as e:
+        run_configs(CONFIGS, process_config, workers=2)
+
+    assert str(e.value) == 'disaster'
+    assert 'brief_responses_summary' not in finished
+    assert 'opportunity_data' not in finished
+
+
+def test_run_configs_raises_on_circular_dependencies():
+    configs = [
+        {'name': 'a', 'model': 'b'},
+        {'name': 'b', 'model': 'a'},
+    ]
+
+    with pytest.raises(ValueError) as e:
+        run_configs(configs, lambda config: None, workers=2)
+
+    assert str(e.value) == "Circular dependencies between configs: a, b"
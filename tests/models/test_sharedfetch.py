@@ -0,0 +1,60 @@
+import mock
+from pandas import DataFrame
+
+from dmscripts.models.sharedfetch import SharedFetches, base_model_keys
+
+
+def users_config(name, keys, **kwargs):
+    return dict({'name': name, 'base_model': 'users', 'keys': keys, 'get_data_kwargs': {}}, **kwargs)
+
+
+def fake_fetch(keys):
+    names = [key[-1] if isinstance(key, tuple) else key for key in keys]
+    return DataFrame([{name: '{}-{}'.format(name, i) for name in names} for i in range(2)])
+
+
+def test_base_model_keys_include_json_fields():
+    config = users_config('example', ('id', 'role'), assign_json_subfields={'brief': ['title']})
+
+    assert base_model_keys(config) == ['id', 'role', 'brief']
+
+
+def test_configs_with_the_same_fetch_share_it():
+    buyers = users_config('buyer_users', ('id', 'emailAddress', 'role'))
+    suppliers = users_config('supplier_users', ('id', ('supplier', 'supplierId'), 'role'))
+    fetches = SharedFetches([buyers, suppliers])
+    fetch = mock.Mock(side_effect=fake_fetch)
+
+    buyer_data = fetches.get(buyers, fetch)
+    supplier_data = fetches.get(suppliers, fetch)
+
+    fetch.assert_called_once_with(['id', 'emailAddress', 'role', ('supplier', 'supplierId')])
+    assert buyer_data.columns.tolist() == ['id', 'emailAddress', 'role']
+    assert supplier_data.columns.tolist() == ['id', 'supplierId', 'role']
+    assert supplier_data['supplierId'].tolist() == ['supplierId-0', 'supplierId-1']
+
+    # Each config gets its own copy
+    buyer_data['id'] = 'changed'
+    assert supplier_data['id'].tolist() == ['id-0', 'id-1']
+    # and the shared data isn't kept once every config has had it
+    assert fetches._frames == {}
+
+
+def test_configs_with_different_fetches_dont_share():
+    buyers = users_config('buyer_users', ('id',), get_data_kwargs={'role': 'buyer'})
+    suppliers = users_config('supplier_users', ('id',), get_data_kwargs={'role': 'supplier'})
+    fetches = SharedFetches([buyers, suppliers])
+    fetch = mock.Mock(side_effect=fake_fetch)
+
+    fetches.get(buyers, fetch)
+    fetches.get(suppliers, fetch)
+
+    assert fetch.call_args_list == [mock.call(['id']), mock.call(['id'])]
+    assert not fetches.is_shared(buyers)
+
+
+def test_configs_fetching_different_keys_with_the_same_name_dont_share():
+    buyers = users_config('buyer_users', ('id', 'name'))
+    suppliers = users_config('supplier_users', ('id', ('supplier', 'name')))
+
+    assert not SharedFetches([buyers, suppliers]).is_shared(buyers)
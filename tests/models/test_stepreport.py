@@ -0,0 +1,44 @@
+import json
+
+import mock
+from pandas import DataFrame
+
+from dmscripts.models.stepreport import StepReport
+
+
+@mock.patch('dmscripts.models.stepreport.current_memory', side_effect=[2 ** 20, 2 ** 20, 3 * 2 ** 20])
+@mock.patch('dmscripts.models.stepreport.time.perf_counter', side_effect=[1.0, 2.5, 3.0])
+def test_recorder_records_rows_time_and_memory_of_each_step(perf_counter, current_memory):
+    report = StepReport()
+    steps = report.recorder('example')
+
+    steps.record('fetch', DataFrame({'id': range(4)}))
+    steps.record('filter', DataFrame({'id': range(1)}))
+
+    assert report.steps == [
+        {'config': 'example', 'step': 'fetch', 'rows_in': None, 'rows_out': 4, 'seconds': 1.5, 'memory_delta_mb': 0},
+        {'config': 'example', 'step': 'filter', 'rows_in': 4, 'rows_out': 1, 'seconds': 0.5, 'memory_delta_mb': 2},
+    ]
+
+
+@mock.patch('dmscripts.models.stepreport.current_memory', return_value=None)
+def test_memory_delta_is_none_when_memory_cant_be_read(current_memory):
+    report = StepReport()
+    report.recorder('example').record('fetch', DataFrame())
+
+    assert report.steps[0]['memory_delta_mb'] is None
+
+
+def test_write_includes_totals_for_each_step(tmpdir):
+    report = StepReport()
+    for config, seconds in (('one', 1.0), ('two', 2.0)):
+        report.add({'config': config, 'step': 'fetch', 'seconds': seconds})
+    report.add({'config': 'one', 'step': 'sort', 'seconds': 0.5})
+
+    report.write(str(tmpdir.join('report.json')), stage='preview')
+
+    written = json.loads(tmpdir.join('report.json').read())
+    assert written['stage'] == 'preview'
+    assert written['steps'] == report.steps
+    assert written['totals'] == {'fetch': 3.0, 'sort': 0.5}
+    assert report.totals() == [('fetch', 3.0), ('sort', 0.5)]
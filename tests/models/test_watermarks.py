@@ -0,0 +1,21 @@
+import numpy
+
+from dmscripts.models.watermarks import Watermarks
+
+
+def test_watermarks_are_kept_between_runs(tmpdir):
+    Watermarks(str(tmpdir)).set('briefs', numpy.int64(10))
+
+    watermarks = Watermarks(str(tmpdir))
+
+    assert watermarks.get('briefs') == 10
+    assert watermarks.get('brief_responses') is None
+
+
+def test_changes_are_only_kept_for_the_run(tmpdir):
+    watermarks = Watermarks(str(tmpdir))
+    watermarks.mark_changed('briefs')
+
+    assert watermarks.any_changed({'briefs', 'brief_responses'})
+    assert not watermarks.any_changed({'brief_responses'})
+    assert not Watermarks(str(tmpdir)).any_changed({'briefs'})
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from pandas import DataFrame
+
+from dmscripts.models.writecsv import append_data, csv_path, data_path, read_column, read_data, write_data
+
+
+def test_data_path_uses_the_format_as_the_extension():
+    assert data_path('data', 'briefs', 'parquet') == os.path.join('data', 'briefs.parquet')
+    assert csv_path('data', 'briefs') == os.path.join('data', 'briefs.csv')
+
+
+def test_write_data_writes_a_csv_by_default(tmpdir):
+    filename = write_data(DataFrame([{'id': 1, 'status': 'live'}]), str(tmpdir), 'briefs')
+
+    assert filename == csv_path(str(tmpdir), 'briefs')
+    assert read_data(str(tmpdir), 'briefs').to_dict('records') == [{'id': 1, 'status': 'live'}]
+
+
+def test_parquet_keeps_column_types(tmpdir):
+    data = DataFrame([{'id': 1, 'value': '1000', 'flag': True}, {'id': 2, 'value': '0100', 'flag': False}])
+    write_data(data, str(tmpdir), 'briefs', 'parquet')
+
+    assert read_data(str(tmpdir), 'briefs', 'parquet').to_dict('records') == [
+        {'id': 1, 'value': '1000', 'flag': True},
+        {'id': 2, 'value': '0100', 'flag': False},
+    ]
+
+
+def test_parquet_writes_blanks_in_columns_of_other_types_as_nulls(tmpdir):
+    data = DataFrame([{'id': 1, 'awardedBriefResponseId': 5}, {'id': 2, 'awardedBriefResponseId': ''}])
+    write_data(data, str(tmpdir), 'briefs', 'parquet')
+
+    read = read_data(str(tmpdir), 'briefs', 'parquet')
+    assert read['awardedBriefResponseId'][0] == 5
+    assert read['awardedBriefResponseId'].isnull().tolist() == [False, True]
+    # The frame written isn't changed
+    assert data['awardedBriefResponseId'].tolist() == [5, '']
+
+
+def test_parquet_writes_columns_of_mixed_types_as_strings(tmpdir):
+    write_data(DataFrame([{'value': 1}, {'value': 'one'}]), str(tmpdir), 'briefs', 'parquet')
+
+    assert read_data(str(tmpdir), 'briefs', 'parquet')['value'].tolist() == ['1', 'one']
+
+
+def test_read_data_falls_back_to_a_csv(tmpdir):
+    write_data(DataFrame([{'id': 1}]), str(tmpdir), 'briefs')
+
+    assert read_data(str(tmpdir), 'briefs', 'parquet').to_dict('records') == [{'id': 1}]
+
+
+@pytest.mark.parametrize('data_format', ('csv', 'parquet'))
+def test_append_data_adds_rows_to_the_end(tmpdir, data_format):
+    write_data(DataFrame([{'id': 2, 'value': ''}]), str(tmpdir), 'briefs', data_format)
+
+    append_data(DataFrame([{'id': 1, 'value': 'a'}]), str(tmpdir), 'briefs', data_format)
+
+    data = read_data(str(tmpdir), 'briefs', data_format)
+    assert data['id'].tolist() == [2, 1]
+    assert data['value'].fillna('').tolist() == ['', 'a']
+
+
+def test_read_column_reads_values_as_written(tmpdir):
+    write_data(DataFrame([{'id': 1, 'value': 1.0}, {'id': 2, 'value': ''}]), str(tmpdir), 'briefs')
+
+    assert read_column(str(tmpdir), 'briefs', 'value').tolist() == ['1.0', '']
+
+
+def test_append_data_needs_the_same_columns(tmpdir):
+    write_data(DataFrame([{'id': 2}]), str(tmpdir), 'briefs')
+
+    with pytest.raises(ValueError):
+        append_data(DataFrame([{'id': 1, 'value': 'a'}]), str(tmpdir), 'briefs')
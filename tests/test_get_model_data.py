@@ -0,0 +1,235 @@
+import os
+from datetime import datetime, timedelta
+
+import mock
+import pandas
+import pytest
+from dmutils.formats import DATETIME_FORMAT
+
+from dmscripts.get_model_data import CONFIGS, INTERMEDIATE_MODELS, process_config
+from dmscripts.models.fakeapi import FakeDataAPIClient
+from dmscripts.models.planner import plan_config
+from dmscripts.models.rawcache import RawModelCache
+from dmscripts.models.registry import FrameRegistry
+from dmscripts.models.stepreport import StepReport
+from dmscripts.models.watermarks import Watermarks
+
+
+@pytest.mark.parametrize('plan', (False, True))
+def test_all_configs_run_against_generated_data(tmpdir, plan):
+    client = FakeDataAPIClient(scale=500)
+    registry = FrameRegistry()
+
+    for config in CONFIGS:
+        process_config(plan_config(config) if plan else config, client, str(tmpdir), mock.Mock(), registry=registry)
+
+    for config in CONFIGS:
+        data = pandas.read_csv(os.path.join(str(tmpdir), '{}.csv'.format(config['name'])))
+        assert len(data), config['name']
+
+
+def test_parquet_is_written_next_to_the_csv_of_intermediate_models(tmpdir):
+    client = FakeDataAPIClient(scale=500)
+    csv_dir, parquet_dir = tmpdir.mkdir('csv'), tmpdir.mkdir('parquet')
+
+    for output_dir, data_format in ((csv_dir, 'csv'), (parquet_dir, 'parquet')):
+        for config in CONFIGS:
+            process_config(config, client, str(output_dir), mock.Mock(), data_format=data_format)
+
+    assert {path.basename for path in parquet_dir.listdir('*.csv')} == {
+        '{}.csv'.format(config['name']) for config in CONFIGS
+    }
+    # Configs built from others read them back from the parquet, so may format values differently
+    for config in CONFIGS:
+        if 'base_model' in config:
+            assert parquet_dir.join('{}.csv'.format(config['name'])).read_text('utf-8') == \
+                csv_dir.join('{}.csv'.format(config['name'])).read_text('utf-8'), config['name']
+    assert {path.basename for path in parquet_dir.listdir('*.parquet')} == {
+        '{}.parquet'.format(name) for name in INTERMEDIATE_MODELS
+    }
+
+
+@pytest.mark.parametrize('data_format', ('csv', 'parquet'))
+def test_configs_built_from_others_give_the_same_output_when_run_on_their_own(tmpdir, data_format):
+    client = FakeDataAPIClient(scale=500)
+    registry = FrameRegistry()
+
+    for config in CONFIGS:
+        process_config(config, client, str(tmpdir), mock.Mock(), registry=registry, data_format=data_format)
+    full_run = {config['name']: tmpdir.join('{}.csv'.format(config['name'])).read_text('utf-8') for config in CONFIGS}
+
+    # Without a registry, each config reads the ones it's built from back from the files of the full run
+    for config in CONFIGS:
+        if 'model' in config:
+            process_config(config, client, str(tmpdir), mock.Mock(), data_format=data_format)
+            assert tmpdir.join('{}.csv'.format(config['name'])).read_text('utf-8') == full_run[config['name']], \
+                config['name']
+
+
+def test_planning_configs_doesnt_change_their_output(tmpdir):
+    client = FakeDataAPIClient(scale=500)
+    outputs = {}
+
+    for plan in (False, True):
+        output_dir = tmpdir.mkdir(str(plan))
+        for config in CONFIGS:
+            process_config(plan_config(config) if plan else config, client, str(output_dir), mock.Mock())
+        outputs[plan] = {
+            config['name']: output_dir.join('{}.csv'.format(config['name'])).read_text('utf-8') for config in CONFIGS
+        }
+
+    assert outputs[True] == outputs[False]
+
+
+def test_each_step_is_recorded(tmpdir):
+    config = next(config for config in CONFIGS if config['name'] == 'buyer_users')
+    report = StepReport()
+
+    process_config(plan_config(config), FakeDataAPIClient(scale=500), str(tmpdir), mock.Mock(), report=report)
+
+    assert [step['step'] for step in report.steps] == ['fetch', 'process', 'filter', 'keys', 'sort', 'write']
+    assert {step['config'] for step in report.steps} == {'buyer_users'}
+    assert report.steps[0]['rows_in'] is None
+    for before, after in zip(report.steps, report.steps[1:]):
+        assert after['rows_in'] == before['rows_out']
+    assert report.steps[-1]['rows_out'] == len(pandas.read_csv(str(tmpdir.join('buyer_users.csv'))))
+
+
+class EarlierClient(object):
+    """Serves the models of a FakeDataAPIClient as they might have been at `time`.
+
+    Brief responses submitted after `time` are left out, as if they were still drafts. Of the other models only the
+    first `fraction` are served, as if the rest hadn't been added yet.
+    """
+
+    def __init__(self, client, time, fraction):
+        self.client = client
+        self.time = time
+        self.fraction = fraction
+
+    def __getattr__(self, name):
+        def find_iter(**kwargs):
+            models = list(getattr(self.client, name)(**kwargs))
+            if name == 'find_brief_responses_iter':
+                return iter([model for model in models if model['submittedAt'] <= self.time])
+            return iter(models[:int(len(models) * self.fraction)])
+        return find_iter
+
+
+class ChangedClient(object):
+    """Serves the models of a FakeDataAPIClient with `changes` made to the model with id 1 of each `find_<model>_iter`
+    named, as if it had been changed since.
+    """
+
+    def __init__(self, client, **changes):
+        self.client = client
+        self.changes = changes
+
+    def __getattr__(self, name):
+        def find_iter(**kwargs):
+            for model in getattr(self.client, name)(**kwargs):
+                yield dict(model, **self.changes[name]) if name in self.changes and model['id'] == 1 else model
+        return find_iter
+
+
+def read_rows(output_dir, name):
+    data = pandas.read_csv(str(output_dir.join('{}.csv'.format(name))), dtype=str, keep_default_na=False)
+    return data.sort_values(list(data.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('data_format', ('csv', 'parquet'))
+def test_incremental_runs_add_new_records_to_the_output(tmpdir, data_format):
+    client = FakeDataAPIClient(scale=500)
+    full_dir, incremental_dir = tmpdir.mkdir('full'), tmpdir.mkdir('incremental')
+
+    for config in CONFIGS:
+        process_config(config, client, str(full_dir), mock.Mock(), data_format=data_format)
+
+    earlier_client = EarlierClient(client, '2018-01-01T00:00:00.000000Z', 0.8)
+    for run_client, incremental in ((earlier_client, False), (client, True)):
+        watermarks = Watermarks(str(incremental_dir))
+        logger = mock.Mock()
+        for config in CONFIGS:
+            process_config(
+                config, run_client, str(incremental_dir), logger, data_format=data_format, watermarks=watermarks,
+                incremental=incremental
+            )
+
+    earlier_ids = set(response['id'] for response in earlier_client.find_brief_responses_iter())
+    added_ids = set(response['id'] for response in client.find_brief_responses_iter()) - earlier_ids
+    # Responses are given their ids as drafts, so many submitted since were given theirs before the earlier run
+    assert min(added_ids) < max(earlier_ids)
+    for extension in ('csv', data_format):
+        logger.info.assert_any_call('Added {} rows to `{}`'.format(
+            len(added_ids), incremental_dir.join('brief_responses.{}'.format(extension))
+        ))
+
+    for config in CONFIGS:
+        pandas.testing.assert_frame_equal(
+            read_rows(incremental_dir, config['name']), read_rows(full_dir, config['name']), obj=config['name']
+        )
+
+
+def test_incremental_runs_skip_configs_built_from_unchanged_models(tmpdir):
+    client = FakeDataAPIClient(scale=500)
+    names = ('briefs', 'brief_responses', 'awarded_brief_responses')
+    configs = [config for config in CONFIGS if config['name'] in names]
+
+    for incremental in (False, True):
+        watermarks = Watermarks(str(tmpdir))
+        logger = mock.Mock()
+        for config in configs:
+            process_config(config, client, str(tmpdir), logger, watermarks=watermarks, incremental=incremental)
+
+    last_submitted = max(response['submittedAt'] for response in client.find_brief_responses_iter())
+    assert watermarks.get('brief_responses') == last_submitted
+    logger.info.assert_any_call('0 brief_responses added since submittedAt {}'.format(last_submitted))
+    logger.info.assert_any_call('Skipping awarded_brief_responses, as the models it is built from are unchanged')
+
+
+def test_incremental_runs_only_pick_up_changes_to_records_of_configs_that_arent_incremental(tmpdir):
+    client = FakeDataAPIClient(scale=500)
+    configs = [config for config in CONFIGS if config['name'] in ('briefs', 'brief_responses')]
+    changed_client = ChangedClient(
+        client, find_briefs_iter={'title': 'Changed title'}, find_brief_responses_iter={'supplierName': 'Changed name'}
+    )
+
+    cache = RawModelCache(str(tmpdir.join('cache')))
+
+    for run_client, incremental in ((client, False), (changed_client, True)):
+        watermarks = Watermarks(str(tmpdir))
+        for config in configs:
+            process_config(
+                config, run_client, str(tmpdir), mock.Mock(), watermarks=watermarks, incremental=incremental,
+                cache=cache
+            )
+
+    briefs = pandas.read_csv(str(tmpdir.join('briefs.csv'))).set_index('id')
+    brief_responses = pandas.read_csv(str(tmpdir.join('brief_responses.csv'))).set_index('id')
+    assert briefs.loc[1, 'title'] == 'Changed title'
+    # Brief responses are incremental, so changes to existing ones wait for the next full export
+    assert brief_responses.loc[1, 'supplierName'] != 'Changed name'
+    # Only incremental configs' models are cached, as the cache can be out of date
+    assert {path.basename.split('-')[0] for path in tmpdir.join('cache').listdir()} == {'brief_responses'}
+
+
+def test_incremental_runs_add_records_listed_late_within_the_overlap(tmpdir):
+    client = FakeDataAPIClient(scale=500)
+    config = next(config for config in CONFIGS if config['name'] == 'brief_responses')
+    last_submitted = max(response['submittedAt'] for response in client.find_brief_responses_iter())
+    late_submitted = datetime.strptime(last_submitted, DATETIME_FORMAT) - timedelta(minutes=10)
+    # Submitted just before the last response, but not listed in time for the first run
+    late = ChangedClient(client, find_brief_responses_iter={'submittedAt': late_submitted.strftime(DATETIME_FORMAT)})
+
+    not_listed = mock.Mock(find_brief_responses_iter=lambda **kwargs: (
+        response for response in client.find_brief_responses_iter(**kwargs) if response['id'] != 1
+    ))
+
+    for run_client, incremental in ((not_listed, False), (late, True)):
+        watermarks = Watermarks(str(tmpdir))
+        logger = mock.Mock()
+        process_config(config, run_client, str(tmpdir), logger, watermarks=watermarks, incremental=incremental)
+
+    logger.info.assert_any_call('1 brief_responses added since submittedAt {}'.format(last_submitted))
+    assert sorted(read_rows(tmpdir, 'brief_responses')['id'].astype(int)) == \
+        sorted(response['id'] for response in client.find_brief_responses_iter())
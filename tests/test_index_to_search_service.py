@@ -1,11 +1,19 @@
+import json
+import threading
+import time
+from datetime import datetime
+
 import mock
 import pytest
 
 from dmapiclient import HTTPError
 from dmscripts.index_to_search_service import (
-    do_index, BriefIndexer, ServiceIndexer
+    do_index, item_streams, limit_concurrency, run_pipeline, send_changed,
+    AdaptiveConcurrency, BriefIndexer, DeletedItem, DocumentHashes, IndexCheckpoint, ServiceIndexer
 
 )
+from dmscripts.models.fakeapi import FakeSearchAPIClient
+from dmscripts.models.watermarks import Watermarks
 
 
 class TestIndexers:
@@ -29,7 +37,7 @@ class TestIndexers:
         indexer = BriefIndexer(
             'briefs', self.data_api_client.return_value, self.search_api_client.return_value, 'myIndex'
         )
-        indexer.create_index('myMapping')
+        assert indexer.create_index('myMapping') is True
 
     def test_brief_indexer_skips_create_if_index_already_exists(self):
         self.search_api_client.return_value.create_index.side_effect = HTTPError(
@@ -38,7 +46,7 @@ class TestIndexers:
         indexer = BriefIndexer(
             'briefs', self.data_api_client.return_value, self.search_api_client.return_value, 'myIndex'
         )
-        indexer.create_index('myMapping')
+        assert indexer.create_index('myMapping') is False
 
     def test_brief_indexer_create_index_raises_on_other_api_errors(self):
         self.search_api_client.return_value.create_index.side_effect = HTTPError('disaster')
@@ -101,6 +109,324 @@ class TestIndexers:
             mock.call('myIndex', 'newService')
         ]
 
+    def test_index_items_sends_each_item_on_its_own_without_bulk_requests(self):
+        indexer = ServiceIndexer(
+            'services', self.data_api_client.return_value, self.search_api_client.return_value, 'myIndex'
+        )
+        self.search_api_client.return_value.delete.side_effect = HTTPError('disaster')
+
+        assert indexer.index_items([
+            {'id': 'newService', 'status': 'published'}, {'id': 'oldService', 'status': 'removed'}
+        ]) == [True, False]
+        assert self.search_api_client.return_value.index.call_args_list == [
+            mock.call('myIndex', 'newService', {'id': 'newService', 'status': 'published'}, 'services')
+        ]
+
+    def test_index_items_sends_items_in_one_bulk_request(self):
+        search_client = FakeSearchAPIClient()
+        search_client.indexes['myIndex'] = {'oldService': {'id': 'oldService'}}
+        indexer = ServiceIndexer('services', self.data_api_client.return_value, search_client, 'myIndex')
+
+        assert indexer.index_items([
+            {'id': 'newService', 'status': 'published'}, {'id': 'oldService', 'status': 'removed'}
+        ]) == [True, True]
+        assert search_client.indexes == {'myIndex': {'newService': {'id': 'newService', 'status': 'published'}}}
+        assert search_client.requests == 1
+
+    def test_index_items_reports_bulk_errors_for_each_item(self):
+        search_client = mock.Mock()
+        search_client.bulk.return_value = [{'id': 'brief1', 'error': None}, {'id': 'brief2', 'error': 'bad field'}]
+        indexer = BriefIndexer('briefs', self.data_api_client.return_value, search_client, 'myIndex')
+
+        assert indexer.index_items([{'id': 'brief1'}, {'id': 'brief2'}]) == [True, False]
+        assert search_client.bulk.call_args_list == [mock.call('myIndex', [
+            {'action': 'index', 'id': 'brief1', 'doc_type': 'briefs', 'document': {'id': 'brief1'}},
+            {'action': 'index', 'id': 'brief2', 'doc_type': 'briefs', 'document': {'id': 'brief2'}},
+        ])]
+
+    def test_index_items_matches_bulk_results_to_items_by_id(self):
+        search_client = mock.Mock()
+        search_client.bulk.return_value = [{'id': '2', 'error': 'bad field'}, {'id': '1', 'error': None}]
+        indexer = BriefIndexer('briefs', self.data_api_client.return_value, search_client, 'myIndex')
+
+        assert indexer.index_items([{'id': 1}, {'id': 2}]) == [True, False]
+
+    @pytest.mark.parametrize('results', (
+        [{'id': 'brief1', 'error': None}],
+        [{'id': 'brief1', 'error': None}, {'id': 'brief2', 'error': None}, {'id': 'brief3', 'error': None}],
+        [{'id': 'brief1', 'error': None}, {'id': 'brief3', 'error': None}],
+        [{'id': 'brief1', 'error': None}, {'id': 'brief1', 'error': None}],
+        [{'id': 'brief1', 'error': None}, {'error': None}],
+    ))
+    def test_index_items_fails_every_item_if_bulk_results_are_missing_or_extra(self, results):
+        search_client = mock.Mock()
+        search_client.bulk.return_value = results
+        indexer = BriefIndexer('briefs', self.data_api_client.return_value, search_client, 'myIndex')
+
+        assert indexer.index_items([{'id': 'brief1'}, {'id': 'brief2'}]) == [False, False]
+
+    def test_index_items_fails_every_item_if_the_bulk_request_fails(self):
+        search_client = mock.Mock()
+        search_client.bulk.side_effect = HTTPError('disaster')
+        indexer = BriefIndexer('briefs', self.data_api_client.return_value, search_client, 'myIndex')
+
+        assert indexer.index_items([{'id': 'brief1'}, {'id': 'brief2'}]) == [False, False]
+
+    @mock.patch.object(BriefIndexer, 'index_items', autospec=True)
+    @mock.patch.object(BriefIndexer, 'request_items', autospec=True)
+    def test_do_index_sends_items_in_batches(self, request_items, index_items):
+        request_items.return_value = iter(['brief1', 'brief2', 'brief3'])
+        index_items.side_effect = lambda self, items: [True] * len(items)
+        self.search_api_client.return_value.bulk = mock.Mock()
+
+        assert do_index(
+            'briefs',
+            "http://search-api-url", "mySearchAPIToken",
+            "http://data-api-url", "myDataAPIToken",
+            mapping=False,
+            serial=True,
+            index="myIndex",
+            frameworks="framework1",
+            bulk_size=2,
+        )
+        assert index_items.call_args_list == [
+            mock.call(mock.ANY, ['brief1', 'brief2']),
+            mock.call(mock.ANY, ['brief3']),
+        ]
+
+    @mock.patch.object(BriefIndexer, 'request_items', autospec=True)
+    def test_do_index_refuses_a_bulk_size_without_bulk_requests(self, request_items):
+        with pytest.raises(ValueError):
+            do_index(
+                'briefs',
+                "http://search-api-url", "mySearchAPIToken",
+                "http://data-api-url", "myDataAPIToken",
+                mapping=False,
+                serial=True,
+                index="myIndex",
+                frameworks="framework1",
+                bulk_size=2,
+            )
+
+        assert request_items.called is False
+
+    def test_service_indexer_requests_services_changed_since(self):
+        data_api_client = self.data_api_client.return_value
+        data_api_client.find_audit_events_iter.return_value = iter([
+            {'objectId': 103, 'data': {'serviceId': '3'}, 'createdAt': '2018-10-17T12:00:00.000000Z'},
+            {'objectId': 101, 'data': {'serviceId': '1'}, 'createdAt': '2018-10-17T11:00:00.000000Z'},
+            {'objectId': 102, 'data': {'serviceId': '2'}, 'createdAt': '2018-10-17T10:00:00.000000Z'},
+            {'objectId': 104, 'data': {'serviceId': '4'}, 'createdAt': '2018-10-17T10:00:00.000000Z'},
+            {'objectId': 103, 'data': {'serviceId': '3'}, 'createdAt': '2018-10-17T10:00:00.000000Z'},
+            {'objectId': 106, 'data': {}, 'createdAt': '2018-10-17T10:00:00.000000Z'},
+            {'objectId': 105, 'data': {'serviceId': '5'}, 'createdAt': '2018-10-17T09:00:00.000000Z'},
+        ])
+        data_api_client.get_service.side_effect = lambda service_id: {
+            '1': {'services': {'id': '1', 'frameworkSlug': 'g-cloud-10', 'status': 'disabled'}},
+            '2': {'services': {'id': '2', 'frameworkSlug': 'g-cloud-9', 'status': 'published'}},
+            '3': {'services': {'id': '3', 'frameworkSlug': 'g-cloud-10', 'status': 'published'}},
+        }.get(service_id)
+        indexer = ServiceIndexer('services', data_api_client, self.search_api_client.return_value, 'myIndex')
+
+        items = list(indexer.request_items_changed_since('g-cloud-10', '2018-10-17T09:30:00.000000Z'))
+
+        # Disabled and missing services are included so they're deleted from the index
+        assert items == [
+            {'id': '3', 'frameworkSlug': 'g-cloud-10', 'status': 'published'},
+            {'id': '1', 'frameworkSlug': 'g-cloud-10', 'status': 'disabled'},
+            {'id': '4'},
+        ]
+        assert isinstance(items[2], DeletedItem)
+        assert data_api_client.find_audit_events_iter.call_args_list == [
+            mock.call(object_type='services', latest_first=True)
+        ]
+        assert data_api_client.get_service.call_args_list == [
+            mock.call('3'), mock.call('1'), mock.call('2'), mock.call('4')
+        ]
+
+    def test_brief_indexer_requests_briefs_changed_or_closed_since(self):
+        data_api_client = self.data_api_client.return_value
+        data_api_client.find_audit_events_iter.return_value = iter([
+            {'objectId': 1, 'createdAt': '2100-01-01T00:00:00.000000Z'},
+            {'objectId': 2, 'createdAt': '2100-01-01T00:00:00.000000Z'},
+        ])
+        data_api_client.get_brief.side_effect = [
+            {'briefs': {'id': 1, 'frameworkSlug': 'dos'}}, HTTPError(mock.Mock(status_code=404))
+        ]
+        data_api_client.find_briefs_iter.return_value = iter([{'id': 1, 'frameworkSlug': 'dos'}, {'id': 5}])
+        indexer = BriefIndexer('briefs', data_api_client, self.search_api_client.return_value, 'myIndex')
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+
+        items = list(indexer.request_items_changed_since('dos', today + 'T00:00:00.000000Z'))
+
+        assert items == [{'id': 1, 'frameworkSlug': 'dos'}, {'id': 2}, {'id': 5}]
+        assert isinstance(items[1], DeletedItem)
+        assert data_api_client.find_briefs_iter.call_args_list == [mock.call(framework='dos', closed_on=today)]
+
+    def test_deleted_items_are_deleted_from_the_index(self):
+        search_api_client = self.search_api_client.return_value
+        indexer = BriefIndexer('briefs', self.data_api_client.return_value, search_api_client, 'myIndex')
+
+        assert indexer(DeletedItem(2)) is True
+        assert indexer.item_action(DeletedItem(2)) == {'action': 'delete', 'id': 2}
+        assert search_api_client.delete.call_args_list == [mock.call('myIndex', 2)]
+        assert search_api_client.index.called is False
+
+    @mock.patch.object(ServiceIndexer, 'index_item', autospec=True)
+    @mock.patch.object(ServiceIndexer, 'request_items_changed_since', autospec=True)
+    def test_do_index_indexes_items_changed_since_the_last_run(self, request_items_changed_since, index_item, tmpdir):
+        watermarks = Watermarks(str(tmpdir))
+        watermarks.set('myIndex', '2018-10-17T09:00:00.000000Z')
+        request_items_changed_since.return_value = [{'id': 1, 'status': 'published'}]
+
+        assert do_index(
+            'services',
+            "http://search-api-url", "mySearchAPIToken",
+            "http://data-api-url", "myDataAPIToken",
+            mapping=False,
+            serial=True,
+            index="myIndex",
+            frameworks="g-cloud-10",
+            watermarks=watermarks,
+        )
+
+        assert request_items_changed_since.call_args_list == [
+            mock.call(mock.ANY, 'g-cloud-10', '2018-10-17T09:00:00.000000Z')
+        ]
+        assert watermarks.get('myIndex') > '2018-10-17T09:00:00.000000Z'
+
+    @mock.patch.object(ServiceIndexer, 'index_item', autospec=True)
+    @mock.patch.object(ServiceIndexer, 'request_items', autospec=True)
+    def test_do_index_doesnt_move_the_watermark_on_if_items_fail(self, request_items, index_item, tmpdir):
+        watermarks = Watermarks(str(tmpdir))
+        request_items.return_value = [{'id': 1, 'status': 'published'}]
+        index_item.side_effect = HTTPError('disaster')
+
+        assert not do_index(
+            'services',
+            "http://search-api-url", "mySearchAPIToken",
+            "http://data-api-url", "myDataAPIToken",
+            mapping=False,
+            serial=True,
+            index="myIndex",
+            frameworks="g-cloud-10",
+            watermarks=watermarks,
+        )
+
+        assert watermarks.get('myIndex') is None
+
+    def test_do_index_resumes_from_its_checkpoint(self, tmpdir):
+        pages = {
+            1: {'services': [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'published'}],
+                'links': {'next': 'page-2'}},
+            2: {'services': [{'id': 3, 'status': 'published'}, {'id': 4, 'status': 'published'}],
+                'links': {'next': 'page-3'}},
+            3: {'services': [{'id': 5, 'status': 'published'}], 'links': {}},
+        }
+        self.data_api_client.return_value.find_services.side_effect = lambda page, **kwargs: pages[page]
+        search_client = self.search_api_client.return_value
+        search_client.index.side_effect = [None, None, None, RuntimeError('interrupted')]
+        checkpoint_file = str(tmpdir.join('checkpoint.json'))
+        kwargs = dict(
+            mapping=False, serial=True, index="myIndex", frameworks="g-cloud-10", checkpoint_file=checkpoint_file
+        )
+
+        with pytest.raises(RuntimeError):
+            do_index('services', "http://search-api-url", "mySearchAPIToken",
+                     "http://data-api-url", "myDataAPIToken", **kwargs)
+
+        with open(checkpoint_file) as f:
+            assert json.load(f)['pages'] == 1
+
+        search_client.index.side_effect = None
+        assert do_index('services', "http://search-api-url", "mySearchAPIToken",
+                        "http://data-api-url", "myDataAPIToken", resume=True, **kwargs)
+
+        assert [c[0][1] for c in search_client.index.call_args_list] == [1, 2, 3, 4, 3, 4, 5]
+        assert not tmpdir.join('checkpoint.json').exists()
+
+    def test_do_index_only_sends_changed_documents_with_a_hash_store(self, tmpdir):
+        services = [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'published'}]
+        self.data_api_client.return_value.find_services_iter.side_effect = lambda **kwargs: iter(services)
+        search_client = self.search_api_client.return_value
+        kwargs = dict(
+            mapping=False, serial=True, index="myIndex", frameworks="g-cloud-10",
+            hash_store=str(tmpdir.join('hashes.json')),
+        )
+
+        for _ in range(2):
+            assert do_index('services', "http://search-api-url", "mySearchAPIToken",
+                            "http://data-api-url", "myDataAPIToken", **kwargs)
+        assert [c[0][1] for c in search_client.index.call_args_list] == [1, 2]
+
+        services[1] = {'id': 2, 'status': 'disabled'}
+        assert do_index('services', "http://search-api-url", "mySearchAPIToken",
+                        "http://data-api-url", "myDataAPIToken", **kwargs)
+        assert search_client.delete.call_args_list == [mock.call('myIndex', 2)]
+
+        assert do_index('services', "http://search-api-url", "mySearchAPIToken",
+                        "http://data-api-url", "myDataAPIToken", force=True, **kwargs)
+        assert [c[0][1] for c in search_client.index.call_args_list] == [1, 2, 1]
+        assert search_client.delete.call_args_list == [mock.call('myIndex', 2), mock.call('myIndex', 2)]
+
+    def test_do_index_forgets_the_hashes_of_an_index_it_creates(self, tmpdir):
+        self.data_api_client.return_value.find_services_iter.side_effect = lambda **kwargs: iter([
+            {'id': 1, 'status': 'published'}
+        ])
+        search_client = self.search_api_client.return_value
+        kwargs = dict(serial=True, index="myIndex", frameworks="g-cloud-10", hash_store=str(tmpdir.join('hashes.json')))
+
+        for mapping in (False, 'services-g-cloud-10'):
+            assert do_index('services', "http://search-api-url", "mySearchAPIToken",
+                            "http://data-api-url", "myDataAPIToken", mapping=mapping, **kwargs)
+
+        # The index was created afresh the second time, so the unchanged service is sent again
+        assert [c[0][1] for c in search_client.index.call_args_list] == [1, 1]
+
+        search_client.create_index.side_effect = HTTPError(message='myIndex already exists as alias')
+        assert do_index('services', "http://search-api-url", "mySearchAPIToken",
+                        "http://data-api-url", "myDataAPIToken", mapping='services-g-cloud-10', **kwargs)
+        assert [c[0][1] for c in search_client.index.call_args_list] == [1, 1]
+
+    def test_do_index_fetches_each_framework_at_once(self):
+        briefs = {
+            'digital-outcomes-and-specialists-2': [{'id': 1}, {'id': 2}],
+            'digital-outcomes-and-specialists-3': [{'id': 3}],
+        }
+        data_api_client = self.data_api_client.return_value
+        data_api_client.find_briefs_iter.side_effect = lambda framework: iter(briefs[framework])
+
+        with mock.patch('dmscripts.index_to_search_service.logger') as logger:
+            assert do_index(
+                'briefs',
+                "http://search-api-url", "mySearchAPIToken",
+                "http://data-api-url", "myDataAPIToken",
+                mapping=False,
+                serial=False,
+                index="myIndex",
+                frameworks="digital-outcomes-and-specialists-2, digital-outcomes-and-specialists-3",
+                fetch_per_framework=True,
+            )
+
+        assert sorted(c[1]['framework'] for c in data_api_client.find_briefs_iter.call_args_list) == [
+            'digital-outcomes-and-specialists-2', 'digital-outcomes-and-specialists-3'
+        ]
+        assert sorted(c[0][1] for c in self.search_api_client.return_value.index.call_args_list) == [1, 2, 3]
+        logger.info.assert_any_call("{label}: {count} items, {failed} failed", extra={
+            'label': 'digital-outcomes-and-specialists-2', 'count': 2, 'failed': 0
+        })
+
+    def test_item_streams_only_splits_frameworks_for_full_unchecked_reindexes(self):
+        indexer = BriefIndexer('briefs', self.data_api_client.return_value, mock.Mock(), 'myIndex')
+
+        assert [label for label, pages in item_streams(indexer, 'dos-2,dos-3', per_framework=True)] == [
+            'dos-2', 'dos-3'
+        ]
+        assert [label for label, pages in item_streams(indexer, 'dos-2,dos-3')] == [None]
+        assert [
+            label for label, pages in item_streams(indexer, 'dos-2,dos-3', checkpoint=mock.Mock(), per_framework=True)
+        ] == [None]
+
     @mock.patch.object(BriefIndexer, '__init__', autospec=True)
     @mock.patch.object(BriefIndexer, 'index_item', autospec=True)
     @mock.patch.object(BriefIndexer, 'request_items', autospec=True)
@@ -215,3 +541,191 @@ class TestIndexers:
         assert str(e.value) == "Incorrect mapping 'services' for the supplied framework(s): g-cloud-10"
 
         assert create_index.call_args_list == []
+
+
+class TestRunPipeline:
+
+    def test_processes_every_item_of_every_source(self):
+        results = run_pipeline([range(5), range(10, 15)], lambda item: item * 2, workers=3, queue_size=2)
+
+        assert sorted(results) == [0, 2, 4, 6, 8, 20, 22, 24, 26, 28]
+
+    def test_fetching_waits_while_the_queue_is_full(self):
+        fetched, processed = [], []
+        release = threading.Event()
+
+        def source():
+            for item in range(100):
+                fetched.append(item)
+                yield item
+
+        def process(item):
+            release.wait()
+            return item
+
+        consumer = threading.Thread(
+            target=lambda: processed.extend(run_pipeline([source()], process, workers=2, queue_size=3))
+        )
+        consumer.start()
+        time.sleep(0.2)
+
+        # One item for each worker, a full queue and the one the fetcher is waiting to add
+        assert len(fetched) <= 2 + 3 + 1
+
+        release.set()
+        consumer.join()
+        assert sorted(processed) == list(range(100))
+
+    def test_fetching_errors_are_raised(self):
+        def source():
+            yield 1
+            raise ValueError('fetch failed')
+
+        with pytest.raises(ValueError) as e:
+            list(run_pipeline([source()], lambda item: item, workers=2, queue_size=2))
+        assert str(e.value) == 'fetch failed'
+
+    def test_processing_errors_are_raised(self):
+        def process(item):
+            raise ValueError('process failed')
+
+        with pytest.raises(ValueError) as e:
+            list(run_pipeline([range(5)], process, workers=2, queue_size=2))
+        assert str(e.value) == 'process failed'
+
+
+class TestIndexCheckpoint:
+
+    def saved(self, tmpdir):
+        return json.loads(tmpdir.join('checkpoint.json').read())
+
+    def test_pages_are_finished_in_order(self, tmpdir):
+        checkpoint = IndexCheckpoint(str(tmpdir.join('checkpoint.json')), {'index': 'myIndex'})
+        checkpoint.page_fetched(1, 2)
+        checkpoint.page_fetched(2, 1)
+
+        checkpoint.items_done(2, [False])
+        assert not tmpdir.join('checkpoint.json').exists()
+
+        checkpoint.items_done(1, [True, True])
+        assert self.saved(tmpdir) == {
+            'run': {'index': 'myIndex'}, 'started_at': checkpoint.started_at, 'pages': 2, 'failed': 1
+        }
+
+    def test_resume_carries_on_from_the_saved_page(self, tmpdir):
+        tmpdir.join('checkpoint.json').write(json.dumps({
+            'run': {'index': 'myIndex'}, 'started_at': '2018-10-17T09:00:00.000000Z', 'pages': 3, 'failed': 1
+        }))
+        checkpoint = IndexCheckpoint(str(tmpdir.join('checkpoint.json')), {'index': 'myIndex'})
+
+        assert checkpoint.resume() == 4
+        assert checkpoint.failed == 1
+        assert checkpoint.started_at == '2018-10-17T09:00:00.000000Z'
+
+    def test_resume_starts_from_the_first_page_without_a_checkpoint(self, tmpdir):
+        assert IndexCheckpoint(str(tmpdir.join('checkpoint.json')), {'index': 'myIndex'}).resume() == 1
+
+    def test_resume_fails_for_a_different_reindex(self, tmpdir):
+        tmpdir.join('checkpoint.json').write(json.dumps({
+            'run': {'index': 'otherIndex'}, 'started_at': '2018-10-17T09:00:00.000000Z', 'pages': 3, 'failed': 0
+        }))
+
+        with pytest.raises(ValueError):
+            IndexCheckpoint(str(tmpdir.join('checkpoint.json')), {'index': 'myIndex'}).resume()
+
+
+@mock.patch('dmscripts.index_to_search_service.time.perf_counter', return_value=0)
+class TestAdaptiveConcurrency:
+
+    def test_limit_increases_by_one_for_each_limit_of_fast_requests(self, perf_counter):
+        concurrency = AdaptiveConcurrency(1, 3)
+
+        for expected in (2, 2.5, 2.9, 3):
+            concurrency.release(concurrency.acquire(), True)
+            assert concurrency.limit == pytest.approx(expected)
+
+    def test_limit_decreases_for_slow_or_failed_requests(self, perf_counter):
+        concurrency = AdaptiveConcurrency(2, 16)
+        concurrency.limit = 16
+
+        concurrency.release(concurrency.acquire(), False)
+        assert concurrency.limit == 8
+
+        token = concurrency.acquire()
+        perf_counter.return_value = 5
+        concurrency.release(token, True)
+        assert concurrency.limit == 4
+
+        for _ in range(3):
+            concurrency.release(concurrency.acquire(), False)
+        assert concurrency.limit == 2
+
+    @pytest.mark.parametrize('floor, ceiling', ((0, 10), (-1, 10), (11, 10)))
+    def test_floor_must_be_between_one_and_the_ceiling(self, perf_counter, floor, ceiling):
+        with pytest.raises(ValueError):
+            AdaptiveConcurrency(floor, ceiling)
+
+    def test_limit_never_falls_below_a_floor_of_one(self, perf_counter):
+        concurrency = AdaptiveConcurrency(1, 4)
+
+        for _ in range(5):
+            concurrency.release(concurrency.acquire(), False)
+
+        assert concurrency.limit == 1
+        concurrency.release(concurrency.acquire(), True)
+
+    def test_requests_started_before_a_decrease_dont_decrease_it_again(self, perf_counter):
+        concurrency = AdaptiveConcurrency(1, 16)
+        concurrency.limit = 16
+        tokens = [concurrency.acquire() for _ in range(3)]
+
+        for token in tokens:
+            concurrency.release(token, False)
+
+        assert concurrency.limit == 8
+
+    def test_acquire_waits_for_a_request_to_finish_at_the_limit(self, perf_counter):
+        concurrency = AdaptiveConcurrency(1, 1)
+        token = concurrency.acquire()
+        acquired = threading.Event()
+
+        threading.Thread(target=lambda: concurrency.acquire() and acquired.set()).start()
+        assert not acquired.wait(0.1)
+
+        concurrency.release(token, True)
+        assert acquired.wait(1)
+
+    def test_limit_concurrency_reports_errors_as_failures(self, perf_counter):
+        concurrency = mock.Mock()
+
+        def process(entry):
+            raise RuntimeError('disaster')
+
+        with pytest.raises(RuntimeError):
+            limit_concurrency(process, concurrency)((1, 'item'))
+
+        concurrency.release.assert_called_once_with(concurrency.acquire.return_value, False)
+
+
+class TestDocumentHashes:
+
+    def test_hashes_are_kept_between_runs(self, tmpdir):
+        hashes = DocumentHashes(str(tmpdir.join('hashes.json')))
+        hashes.set('myIndex', 1, 'abc')
+        hashes.save()
+
+        hashes = DocumentHashes(str(tmpdir.join('hashes.json')))
+        assert hashes.get('myIndex', 1) == 'abc'
+        assert hashes.get('otherIndex', 1) is None
+
+    def test_send_changed_only_sends_changed_items_and_records_successes(self, tmpdir):
+        hashes = DocumentHashes(str(tmpdir.join('hashes.json')))
+        indexer = ServiceIndexer('services', mock.Mock(), mock.Mock(), 'myIndex')
+        items = [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'published'}]
+        send = mock.Mock(return_value=[True, False])
+
+        assert send_changed(indexer, hashes, items, send) == [True, False]
+        send.return_value = [True]
+        assert send_changed(indexer, hashes, items, send) == [True, True]
+
+        assert send.call_args_list == [mock.call(items), mock.call([items[1]])]